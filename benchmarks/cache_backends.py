@@ -0,0 +1,81 @@
+"""
+Compare storefront request throughput under each cache backend.
+
+Each backend runs in its own process (CACHE_URL is read at settings import)
+against a throwaway database seeded with a synthetic catalog:
+
+    python -m benchmarks.cache_backends locmem:// file:///tmp/pyshop-cache db://pyshop_cache redis://127.0.0.1:6379/1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+PATHS = ['/', '/all/', '/all/?sort=price_low', '/all/?q=premium', '/electronics/', '/products/{product_id}/']
+
+
+def run_worker(requests, products):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pyshop.settings')
+    import django
+    django.setup()
+
+    from django.test import Client
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from products.models import Product
+
+    from .seed import seed_products
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        seed_products(products)
+        product_id = Product.objects.order_by('id').values_list('id', flat=True).first()
+        paths = [path.format(product_id=product_id) for path in PATHS]
+
+        client = Client()
+        for path in paths:
+            client.get(path)
+
+        started = time.perf_counter()
+        for i in range(requests):
+            response = client.get(paths[i % len(paths)])
+            assert response.status_code == 200, (paths[i % len(paths)], response.status_code)
+        elapsed = time.perf_counter() - started
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(json.dumps({'requests': requests, 'seconds': elapsed, 'rps': requests / elapsed}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('backends', nargs='*', default=['locmem://'], help="CACHE_URL values to compare")
+    parser.add_argument('--requests', type=int, default=600)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.products)
+        return
+
+    print(f"{'backend':<40} {'requests':>9} {'req/s':>9}")
+    for backend in args.backends:
+        env = dict(os.environ, CACHE_URL=backend)
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.cache_backends', '--worker',
+             '--requests', str(args.requests), '--products', str(args.products)],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(f"{backend:<40} failed: {result.stderr.strip().splitlines()[-1:]}")
+            continue
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f"{backend:<40} {stats['requests']:>9} {stats['rps']:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,441 @@
+"""
+Load-test the storefront and checkout flows.
+
+A database is migrated and seeded with benchmarks.seed (the same --seed and
+sizes always give the same data), then each scenario is replayed by a number
+of virtual shoppers through the real URLconf, either in-process with the
+Django test client or over HTTP against a local gunicorn:
+
+    python -m benchmarks.load --products 100000
+    python -m benchmarks.load --driver gunicorn --workers 4 --concurrency 8
+    python -m benchmarks.load --json before.json
+    python -m benchmarks.load --json after.json --compare before.json
+
+Each scenario reports p50/p95/p99 latency, mean queries per request (taken
+from the Server-Timing header) and requests per second. Shoppers draw from
+their own seeded RNG, so two runs issue the same requests in the same order.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from .seed import PASSWORD, SEARCH_TERMS, USERNAME, seed_store
+
+
+QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+CATEGORY_PATHS = ['/footwears/', '/groceries/', '/electronics/', '/vehicles/']
+SHIPPING = {'address': '12 Market Road', 'city': 'Lagos', 'country': 'Nigeria', 'phone': '08000000000'}
+
+
+class Catalog:
+    """What the scenarios need to know about the seeded data"""
+
+    def __init__(self, first_product_id, last_product_id, users):
+        self.first_product_id = first_product_id
+        self.last_product_id = last_product_id
+        self.users = users
+
+    def product(self, rng):
+        return rng.randint(self.first_product_id, self.last_product_id)
+
+
+def browse(session, catalog, rng):
+    session.get('/')
+    session.get('/all/')
+    session.get(f'/all/?page={rng.randint(2, 20)}')
+    session.get(rng.choice(CATEGORY_PATHS))
+    session.get('/electronics/?subcategory=Phones&sort=price_low')
+    session.get(f'/products/{catalog.product(rng)}/')
+
+
+def search(session, catalog, rng):
+    term = rng.choice(SEARCH_TERMS)
+    session.get(f'/all/?q={term}')
+    session.get(f'/all/?q={term}+{rng.choice(SEARCH_TERMS)}&sort=price_high')
+    session.get(f'/all/?category=Groceries&min_price=10&max_price={rng.randint(50, 2000)}')
+
+
+def cart(session, catalog, rng):
+    product_id = catalog.product(rng)
+    session.post(f'/products/{product_id}/add-to-cart/')
+    session.get('/cart/')
+    session.get('/get-cart-count/')
+    session.post(f'/cart/update/{product_id}/', {'quantity': rng.randint(1, 3)})
+    session.post(f'/cart/remove/{product_id}/')
+
+
+def checkout(session, catalog, rng):
+    for _ in range(rng.randint(1, 3)):
+        session.post(f'/products/{catalog.product(rng)}/add-to-cart/')
+    session.get('/checkout/')
+    session.post('/checkout/', SHIPPING)
+    session.get('/orders/')
+
+
+SCENARIOS = {'browse': browse, 'search': search, 'cart': cart, 'checkout': checkout}
+# Scenarios that need a signed-in shopper
+LOGGED_IN = {'cart', 'checkout'}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+
+    def add(self, scenario, seconds, status, server_timing):
+        match = QUERIES_RE.search(server_timing or '')
+        with self.lock:
+            self.samples[scenario].append((seconds, status, int(match.group(1)) if match else None))
+
+
+class BaseSession:
+    """One shopper's cookies; every request is timed into the recorder under the current scenario"""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.scenario = None
+
+    def get(self, path):
+        return self._timed('GET', path)
+
+    def post(self, path, data=None):
+        return self._timed('POST', path, data or {})
+
+    def _timed(self, method, path, data=None):
+        started = time.perf_counter()
+        status, server_timing = self.request(method, path, data)
+        elapsed = time.perf_counter() - started
+        if self.scenario:
+            self.recorder.add(self.scenario, elapsed, status, server_timing)
+        return status
+
+    def request(self, method, path, data):
+        raise NotImplementedError
+
+
+class ClientSession(BaseSession):
+    """In-process requests through django.test.Client (no network, no CSRF checks)"""
+
+    def __init__(self, recorder):
+        from django.test import Client
+
+        super().__init__(recorder)
+        self.client = Client()
+
+    def login(self, username, password):
+        from django.contrib.auth.models import User
+
+        self.client.force_login(User.objects.get(username=username))
+
+    def request(self, method, path, data):
+        response = self.client.post(path, data) if method == 'POST' else self.client.get(path)
+        return response.status_code, response.get('Server-Timing')
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession(BaseSession):
+    """Real HTTP requests with a cookie jar; redirects are not followed so each request is timed alone"""
+
+    def __init__(self, recorder, base_url):
+        super().__init__(recorder)
+        self.base_url = base_url
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirects)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        self.request('GET', '/login/', None)
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def login(self, username, password):
+        status, _ = self.request('POST', '/login/', {'username': username, 'password': password})
+        if status != 302:
+            raise RuntimeError(f"Logging in as {username} failed with HTTP {status}")
+
+    def request(self, method, path, data):
+        headers = {}
+        body = None
+        if method == 'POST':
+            token = self.csrf_token()
+            headers['X-CSRFToken'] = token
+            body = urllib.parse.urlencode(dict(data, csrfmiddlewaretoken=token)).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('Server-Timing')
+
+
+def _run_all(target, count):
+    """Call target(index) for every shopper, on threads when there is more than one, re-raising the first error"""
+    if count == 1:
+        target(0)
+        return
+    errors = []
+
+    def run(index):
+        try:
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+def run_scenario(name, sessions, catalog, iterations, warmup=1, seed=0):
+    """Replay scenario `name` on every session at once; returns the wall time of the measured rounds"""
+    scenario = SCENARIOS[name]
+    rngs = [random.Random(f'{seed}:{name}:{index}') for index in range(len(sessions))]
+
+    def replay(rounds, label):
+        def target(index):
+            sessions[index].scenario = label
+            try:
+                for _ in range(rounds):
+                    scenario(sessions[index], catalog, rngs[index])
+            finally:
+                sessions[index].scenario = None
+        return target
+
+    # Warm-up requests fill caches and connections but aren't recorded
+    _run_all(replay(warmup, None), len(sessions))
+    started = time.perf_counter()
+    _run_all(replay(iterations, name), len(sessions))
+    return time.perf_counter() - started
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+def summarize(samples, seconds):
+    latencies = [latency * 1000 for latency, _, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _ in samples if status >= 400),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries_per_request': round(statistics.fmean(queries), 2) if queries else None,
+        'rps': round(len(samples) / seconds, 1) if seconds else None,
+    }
+
+
+def run_benchmark(make_session, scenarios, catalog, concurrency=1, iterations=20, warmup=1, seed=0):
+    """Run each scenario in turn with `concurrency` fresh shoppers; returns {scenario: summary}"""
+    recorder = Recorder()
+    results = {}
+    for name in scenarios:
+        sessions = [make_session(recorder) for _ in range(concurrency)]
+        if name in LOGGED_IN:
+            for index, session in enumerate(sessions):
+                session.login(USERNAME.format(index % catalog.users), PASSWORD)
+        seconds = run_scenario(name, sessions, catalog, iterations, warmup, seed)
+        results[name] = summarize(recorder.samples[name], seconds)
+    return results
+
+
+def prepare_database(args):
+    """Migrate the benchmark database and seed it unless it already holds products"""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db.models import Max, Min
+    from products.models import Product
+
+    call_command('migrate', verbosity=0, interactive=False)
+    if not Product.objects.exists():
+        started = time.perf_counter()
+        seed_store(
+            products=args.products, users=args.users, carts=args.carts, orders=args.orders,
+            seed=args.seed, batch_size=args.batch_size,
+        )
+        print(f"seeded {args.products} products in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    else:
+        print("reusing the products already in the database", file=sys.stderr)
+    ids = Product.objects.aggregate(first=Min('id'), last=Max('id'))
+    return Catalog(ids['first'], ids['last'], User.objects.filter(username__startswith='bench-user-').count())
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(workers, timeout=30):
+    """Serve the project on a free local port; returns (process, base URL)"""
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn', 'pyshop.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+        ],
+        env=dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings'),
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"gunicorn didn't start listening within {timeout}s")
+
+
+def git_revision():
+    try:
+        revision = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty.strip() else '')
+
+
+def print_results(results, baseline=None):
+    print(f"{'scenario':<10} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'req/s':>8}")
+    for name, row in results.items():
+        queries = '-' if row['queries_per_request'] is None else f"{row['queries_per_request']:.1f}"
+        print(
+            f"{name:<10} {row['requests']:>8} {row['errors']:>6} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+            f"{row['p99_ms']:>8.2f} {queries:>8} {row['rps'] or 0:>8.1f}"
+        )
+    if not baseline:
+        return
+    print(f"\nchange against {baseline['meta'].get('revision') or 'baseline'} (negative latency / positive req/s is better)")
+    print(f"{'scenario':<10} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'req/s':>8}")
+    for name, row in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            continue
+
+        def change(key):
+            if not before.get(key) or row.get(key) is None:
+                return '-'
+            return f"{(row[key] - before[key]) / before[key] * 100:+.0f}%"
+
+        print(
+            f"{name:<10} {change('p50_ms'):>8} {change('p95_ms'):>8} {change('p99_ms'):>8} "
+            f"{change('queries_per_request'):>8} {change('rps'):>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', help=f"Any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--driver', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--products', type=int, default=10_000)
+    parser.add_argument('--users', type=int, help="Default: one per 100 products, at least 10")
+    parser.add_argument('--carts', type=int, help="Default: half the users")
+    parser.add_argument('--orders', type=int, help="Default: two per user")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=20, help="Measured rounds per shopper and scenario")
+    parser.add_argument('--warmup', type=int, default=1, help="Unmeasured rounds per shopper before each scenario")
+    parser.add_argument('--concurrency', type=int, default=1, help="Shoppers running each scenario at once")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes")
+    parser.add_argument('--database', help="SQLite file to use; reused as-is if it already holds products (default: a temporary file)")
+    parser.add_argument('--json', help="Write the results, with the git revision and parameters, to this file")
+    parser.add_argument('--compare', help="Results file from an earlier run to compare against")
+    args = parser.parse_args()
+    scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(scenarios) - SCENARIOS.keys()
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    database = args.database
+    if database is None:
+        handle, database = tempfile.mkstemp(prefix='pyshop-benchmark-', suffix='.sqlite3')
+        os.close(handle)
+    os.environ['PYSHOP_BENCHMARK_DB'] = os.path.abspath(database)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+    server = None
+    try:
+        catalog = prepare_database(args)
+        if args.driver == 'gunicorn':
+            server, base_url = start_gunicorn(args.workers)
+
+            def make_session(recorder):
+                return HttpSession(recorder, base_url)
+        else:
+            make_session = ClientSession
+        results = run_benchmark(
+            make_session, scenarios, catalog,
+            concurrency=args.concurrency, iterations=args.iterations, warmup=args.warmup, seed=args.seed,
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if args.database is None:
+            os.remove(database)
+
+    meta = {
+        'revision': git_revision(),
+        'driver': args.driver,
+        'workers': args.workers if args.driver == 'gunicorn' else None,
+        'concurrency': args.concurrency,
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+        'seed': args.seed,
+        'products': args.products,
+        'users': args.users,
+        'carts': args.carts,
+        'orders': args.orders,
+        'cache_url': os.environ.get('CACHE_URL', 'locmem://'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Deterministic synthetic data for the benchmarks.
+
+The same `seed` and sizes always produce the same catalogue, users, carts and
+orders (row for row, in the same id order on a fresh database), so numbers
+taken on different commits are measured against identical data:
+
+    from benchmarks.seed import seed_store
+    seed_store(products=100_000, seed=1)
+"""
+import random
+from decimal import Decimal
+from itertools import islice
+
+
+CATEGORIES = {
+    'Footwears': ['Sneakers', 'Boots', 'Sandals', None],
+    'Groceries': ['Beverages', 'Snacks', 'Grains', None],
+    'Electronics': ['Phones', 'Laptops', 'Audio', None],
+    'Vehicles': ['Cars', 'Motorcycles', 'Parts', None],
+}
+ADJECTIVES = ['classic', 'compact', 'deluxe', 'eco', 'fresh', 'premium', 'rugged', 'smart', 'sport', 'urban']
+NOUNS = ['bundle', 'edition', 'kit', 'model', 'pack', 'series', 'set', 'special', 'standard', 'value']
+# Words guaranteed to occur in names and descriptions, for search scenarios
+SEARCH_TERMS = ADJECTIVES + NOUNS
+PASSWORD = 'benchmark'
+USERNAME = 'bench-user-{:06d}'
+PURCHASE_STATUSES = ['paid', 'processing', 'shipped', 'delivered', 'pending', 'cancelled']
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _price(rng):
+    return Decimal(rng.randint(100, 500_000)) / 100
+
+
+def generate_products(count, rng):
+    """Yield `count` unsaved products with their lookup keys filled in"""
+    from products.models import Product
+
+    categories = sorted(CATEGORIES)
+    for i in range(count):
+        category = categories[i % len(categories)]
+        subcategory = rng.choice(CATEGORIES[category])
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        yield Product(
+            sku=f'BENCH-{i:07d}',
+            name=f'{adjective.title()} {subcategory or category} {noun} {i:07d}',
+            description=f'A {adjective} {noun} from the {category.lower()} range.',
+            price=_price(rng),
+            stock=rng.randint(100, 1000),
+            image_url=f'https://example.com/products/{i}.png',
+            category=category,
+            category_key=Product.normalize_key(category),
+            subcategory=subcategory,
+            subcategory_key=Product.normalize_key(subcategory),
+        )
+
+
+def seed_products(count, seed=0, batch_size=2000):
+    """Insert `count` synthetic products; returns the (first, last) id inserted"""
+    from django.db.models import Max
+    from products.models import Product
+
+    rng = random.Random(seed)
+    start = Product.objects.aggregate(last=Max('id'))['last'] or 0
+    for batch in _batches(generate_products(count, rng), batch_size):
+        Product.objects.bulk_create(batch)
+    end = Product.objects.aggregate(last=Max('id'))['last'] or 0
+    return start + 1, end
+
+
+def seed_store(products=10_000, users=None, carts=None, orders=None, seed=0, batch_size=2000):
+    """
+    Seed a catalogue plus shoppers, carts and order history.
+
+    Users default to one per 100 products (at least 10), half of them with a
+    cart and two orders each on average. Every user's password is PASSWORD.
+    Returns a dict of the row counts and the product id range.
+    """
+    from django.contrib.auth.hashers import make_password
+    from django.contrib.auth.models import User
+    from products.models import Cart, CartItem, Order, OrderItem, Product
+
+    users = max(products // 100, 10) if users is None else users
+    carts = users // 2 if carts is None else min(carts, users)
+    orders = users * 2 if orders is None else orders
+
+    first_id, last_id = seed_products(products, seed=seed, batch_size=batch_size)
+    rng = random.Random(seed + 1)
+
+    # One hash for everyone: hashing per user would dominate seeding time
+    password = make_password(PASSWORD, salt='pyshopbenchmark')
+    User.objects.bulk_create(
+        [User(username=USERNAME.format(i), email=f'user{i}@example.com', password=password) for i in range(users)],
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.filter(username__startswith='bench-user-').order_by('username').values_list('id', flat=True))
+
+    def pick_lines(max_lines):
+        return sorted({rng.randint(first_id, last_id) for _ in range(rng.randint(1, max_lines))})
+
+    Cart.objects.bulk_create([Cart(user_id=user_id) for user_id in user_ids[:carts]], batch_size=batch_size)
+    cart_ids = list(Cart.objects.filter(user_id__in=user_ids[:carts]).order_by('user_id').values_list('id', flat=True))
+    CartItem.objects.bulk_create(
+        [
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=rng.randint(1, 3))
+            for cart_id in cart_ids
+            for product_id in pick_lines(4)
+        ],
+        batch_size=batch_size,
+    )
+
+    # Small batches keep the price lookup's IN list well under SQLite's variable limit
+    for batch in _batches(range(orders), 500):
+        planned = [
+            (i, rng.choice(user_ids), rng.choice(PURCHASE_STATUSES), [(pid, rng.randint(1, 3)) for pid in pick_lines(5)])
+            for i in batch
+        ]
+        prices = dict(Product.objects.filter(
+            id__in={pid for _, _, _, lines in planned for pid, _ in lines},
+        ).values_list('id', 'price'))
+        Order.objects.bulk_create([
+            Order(
+                user_id=user_id,
+                reference=f'BENCH-{seed}-{i:08d}',
+                total_amount=sum(prices[pid] * quantity for pid, quantity in lines),
+                status=status,
+                shipping_address=f'{i % 200 + 1} Market Road',
+                shipping_city='Lagos',
+                shipping_country='Nigeria',
+                phone='08000000000',
+            )
+            for i, user_id, status, lines in planned
+        ])
+        ids = dict(Order.objects.filter(
+            reference__in=[f'BENCH-{seed}-{i:08d}' for i, _, _, _ in planned],
+        ).values_list('reference', 'id'))
+        OrderItem.objects.bulk_create([
+            OrderItem(order_id=ids[f'BENCH-{seed}-{i:08d}'], product_id=pid, quantity=quantity, price=prices[pid])
+            for i, _, _, lines in planned
+            for pid, quantity in lines
+        ])
+
+    return {
+        'products': products, 'users': users, 'carts': carts, 'orders': orders,
+        'first_product_id': first_id, 'last_product_id': last_id,
+    }
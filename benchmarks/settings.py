@@ -0,0 +1,10 @@
+"""Project settings pointed at a throwaway benchmark database, with DEBUG off as in production"""
+import os
+
+from pyshop.settings import *  # noqa: F401,F403
+from pyshop.settings import DATABASES
+
+
+DEBUG = False
+ALLOWED_HOSTS = ['testserver', '127.0.0.1', 'localhost']
+DATABASES = {'default': dict(DATABASES['default'], NAME=os.environ['PYSHOP_BENCHMARK_DB'])}
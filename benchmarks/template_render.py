@@ -0,0 +1,129 @@
+"""
+Measure per-page template render time with and without template caching.
+
+"before" renders through the plain filesystem/app-directories loaders with
+fragment caching disabled, "loader" adds only the cached loader, and "after"
+uses the project settings (cached loader plus {% cache %} fragments). Only
+time spent inside Template.render is counted, so database and view work
+don't blur the comparison:
+
+    python -m benchmarks.template_render --renders 200 --products 2000
+"""
+import argparse
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+PAGES = {
+    'landing': '/',
+    'all products': '/all/',
+    'electronics': '/electronics/',
+    'product detail': '/products/{product_id}/',
+}
+
+
+@contextmanager
+def render_timer(timings):
+    """Record the wall time of every top-level template render into `timings`"""
+    from django.template.backends.django import Template
+
+    original = Template.render
+
+    def timed_render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(self, *args, **kwargs)
+        finally:
+            timings.append(time.perf_counter() - started)
+
+    Template.render = timed_render
+    try:
+        yield
+    finally:
+        Template.render = original
+
+
+def uncached_settings(cached_loader=False):
+    from copy import deepcopy
+
+    from django.conf import settings
+
+    overrides = {
+        'CACHES': dict(settings.CACHES, template_fragments={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}),
+    }
+    if not cached_loader:
+        templates = deepcopy(settings.TEMPLATES)
+        for engine in templates:
+            engine['OPTIONS']['loaders'] = [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]
+        overrides['TEMPLATES'] = templates
+    return overrides
+
+
+def measure(client, paths, renders):
+    results = {}
+    for name, path in paths.items():
+        client.get(path)
+        timings = []
+        with render_timer(timings):
+            for _ in range(renders):
+                response = client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+        results[name] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--renders', type=int, default=200, help="Renders per page and configuration")
+    parser.add_argument('--products', type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pyshop.settings')
+    import django
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.core.cache import caches
+    from django.test import Client, override_settings
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+    from products.models import Product
+
+    from .seed import seed_products
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        seed_products(args.products)
+        product_id = Product.objects.filter(category='Electronics').order_by('id').values_list('id', flat=True).first()
+        paths = {name: path.format(product_id=product_id) for name, path in PAGES.items()}
+
+        client = Client()
+        client.force_login(User.objects.create_user('shopper'))
+
+        runs = {}
+        for label, overrides in (
+            ('before', uncached_settings()),
+            ('loader', uncached_settings(cached_loader=True)),
+            ('after', {}),
+        ):
+            for cache in caches.all():
+                cache.clear()
+            with override_settings(**overrides):
+                runs[label] = measure(client, paths, args.renders)
+    finally:
+        teardown_databases(old_config, verbosity=0)
+
+    print(f"median render time per page (ms), {args.renders} renders each")
+    print(f"{'page':<16} {'before':>8} {'loader':>8} {'after':>8} {'speedup':>8}")
+    for name in PAGES:
+        before, loader, after = (statistics.median(runs[label][name]) * 1000 for label in ('before', 'loader', 'after'))
+        print(f"{name:<16} {before:>8.2f} {loader:>8.2f} {after:>8.2f} {before / after:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,37 @@
+from decimal import Decimal
+
 from django.contrib import admin
-from .models import Product, Offer, Profile, Order, OrderItem, Cart, CartItem
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from .checkout import release_order_stock
+from .pagination import EstimatedCountPaginator
+from .product_io import export_rows
+from .models import Product, Offer, Profile, Order, OrderItem, Cart, CartItem, WebhookEvent, ProductRelation
 
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'category', 'subcategory')
-    search_fields = ('name', 'category', 'subcategory', 'description')
+    list_display = ('name', 'sku', 'price', 'stock', 'reserved_stock', 'category', 'subcategory')
+    search_fields = ('name', 'sku', 'category', 'subcategory', 'description')
     list_filter = ('category', 'subcategory')
+    actions = ['export_csv', 'export_jsonl']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def _export(self, queryset, fmt, content_type):
+        # Streamed row by row so exporting the whole catalogue stays in constant memory
+        response = StreamingHttpResponse(export_rows(queryset, fmt), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+    
+    @admin.action(description='Export selected products as CSV')
+    def export_csv(self, request, queryset):
+        return self._export(queryset, 'csv', 'text/csv; charset=utf-8')
+    
+    @admin.action(description='Export selected products as JSON lines')
+    def export_jsonl(self, request, queryset):
+        return self._export(queryset, 'jsonl', 'application/x-ndjson; charset=utf-8')
 
 
 @admin.register(Offer)
@@ -19,27 +44,53 @@ class OfferAdmin(admin.ModelAdmin):
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone', 'city', 'country')
     search_fields = ('user__username', 'user__email')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
 
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('product', 'quantity', 'price')
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('reference', 'user', 'total_amount', 'status', 'created_at')
+    list_display = ('reference', 'user', 'get_item_count', 'total_amount', 'offer_code', 'status', 'created_at')
     list_filter = ('status', 'created_at')
-    search_fields = ('reference', 'user__username', 'user__email')
-    readonly_fields = ('reference', 'created_at', 'updated_at')
+    search_fields = ('reference', 'user__username', 'user__email', 'offer_code')
+    readonly_fields = ('reference', 'offer', 'offer_code', 'discount_amount', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [OrderItemInline]
+    actions = ['cancel_orders']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(item_count=Coalesce(Sum('items__quantity'), 0))
+    
+    @admin.display(description='Items', ordering='item_count')
+    def get_item_count(self, obj):
+        return obj.item_count
+    
+    @admin.action(description='Cancel selected pending orders and release their stock')
+    def cancel_orders(self, request, queryset):
+        cancelled = sum(release_order_stock(order) for order in queryset.filter(status='pending'))
+        self.message_user(request, f"{cancelled} order(s) cancelled.")
 
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
     readonly_fields = ('added_at',)
+    raw_id_fields = ('product',)
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
 
 
 @admin.register(Cart)
@@ -47,12 +98,47 @@ class CartAdmin(admin.ModelAdmin):
     list_display = ('user', 'get_item_count', 'get_total', 'updated_at')
     search_fields = ('user__username', 'user__email')
     readonly_fields = ('created_at', 'updated_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = [CartItemInline]
     
+    def get_queryset(self, request):
+        # Count and total in the changelist query instead of walking each cart's items
+        return super().get_queryset(request).annotate(
+            item_count=Coalesce(Sum('items__quantity'), 0),
+            total=Coalesce(
+                Sum(CartItem.line_total('items__')),
+                Value(Decimal('0.00')),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+    
+    @admin.display(description='Items', ordering='item_count')
     def get_item_count(self, obj):
-        return obj.get_item_count()
-    get_item_count.short_description = 'Items'
+        return obj.item_count
     
+    @admin.display(description='Total', ordering='total')
     def get_total(self, obj):
-        return f"₦{obj.get_total()}"
-    get_total.short_description = 'Total'
+        return f"₦{obj.total.quantize(Decimal('0.01'))}"
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'event_type', 'payload', 'created_at', 'processed_at', 'last_error')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(ProductRelation)
+class ProductRelationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'related', 'score', 'co_purchases', 'computed_at')
+    list_select_related = ('product', 'related')
+    raw_id_fields = ('product', 'related')
+    search_fields = ('product__name', 'product__sku')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
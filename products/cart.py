@@ -0,0 +1,177 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum, Window
+
+from .instrumentation import record_cache
+from .models import Cart, CartItem, Product
+
+
+CART_SUMMARY_TIMEOUT = 300
+ZERO = Decimal('0.00')
+
+
+def _summary_key(user_id):
+    return f'cart_summary_{user_id}'
+
+
+def get_cart_summary(request):
+    """Return the item count and total of the request's cart without writing anything"""
+    if not request.user.is_authenticated:
+        cart = request.session.get('cart', {})
+        if not cart:
+            return {'count': 0, 'total': ZERO}
+        prices = Product.objects.filter(id__in=[int(pid) for pid in cart]).values_list('id', 'price')
+        # Only products that still exist count, matching what the cart page shows
+        quantities = [(price, cart.get(str(pid), 0)) for pid, price in prices]
+        return {
+            'count': sum(quantity for _, quantity in quantities),
+            'total': sum((price * quantity for price, quantity in quantities), ZERO),
+        }
+
+    key = _summary_key(request.user.id)
+    summary = cache.get(key)
+    record_cache(hit=summary is not None)
+    if summary is None:
+        totals = CartItem.objects.filter(cart__user=request.user).aggregate(
+            count=Sum('quantity'),
+            total=Sum(CartItem.line_total()),
+        )
+        total = (totals['total'] or ZERO).quantize(ZERO)
+        summary = {'count': totals['count'] or 0, 'total': total}
+        cache.set(key, summary, CART_SUMMARY_TIMEOUT)
+    return summary
+
+
+@dataclass
+class CartLine:
+    product: Product
+    quantity: int
+    item_total: Decimal
+
+
+@dataclass
+class CartPricing:
+    lines: list = field(default_factory=list)
+    count: int = 0
+    total: Decimal = ZERO
+    # Set by offers.apply_offer
+    offer: object = None
+    discount: Decimal = ZERO
+
+    @property
+    def payable(self):
+        return self.total - self.discount
+
+
+def price_cart_items(items):
+    """
+    Price a CartItem queryset with one query.
+
+    Each row carries its product, its line total and, as window sums over
+    the whole result, the cart's item count and grand total. All arithmetic
+    is Decimal, so totals match what checkout charges to the kobo.
+    """
+    rows = items.select_related('product').annotate(
+        item_total=CartItem.line_total(),
+        cart_count=Window(Sum('quantity')),
+        cart_total=Window(Sum(CartItem.line_total())),
+    ).order_by('id')
+    pricing = CartPricing()
+    for row in rows:
+        pricing.lines.append(CartLine(row.product, row.quantity, row.item_total))
+        pricing.count, pricing.total = row.cart_count, row.cart_total.quantize(ZERO)
+    return pricing
+
+
+def price_session_cart(session_cart):
+    """Price an anonymous {product_id: quantity} session cart; unknown products are skipped"""
+    quantities = {}
+    for product_id, quantity in session_cart.items():
+        try:
+            quantities[int(product_id)] = int(quantity)
+        except (TypeError, ValueError):
+            continue
+    pricing = CartPricing()
+    for product in Product.objects.filter(id__in=quantities).order_by('id'):
+        quantity = quantities[product.id]
+        pricing.lines.append(CartLine(product, quantity, product.price * quantity))
+        pricing.count += quantity
+        pricing.total += product.price * quantity
+    return pricing
+
+
+def get_cart_pricing(request):
+    """Lines, item count and grand total of the request's cart (session cart when anonymous)"""
+    if not request.user.is_authenticated:
+        return price_session_cart(request.session.get('cart', {}))
+    return price_cart_items(CartItem.objects.filter(cart__user=request.user))
+
+
+def remember_cart_summary(user, pricing):
+    """Cache the summary from a freshly priced cart, so the page showing it doesn't query it again"""
+    cache.set(_summary_key(user.id), {'count': pricing.count, 'total': pricing.total}, CART_SUMMARY_TIMEOUT)
+
+
+def invalidate_cart_summary(user):
+    """Drop the cached summary; call after any change to the user's cart"""
+    cache.delete(_summary_key(user.id))
+
+
+def invalidate_cart_summaries_for(product):
+    """Drop the cached summary of every cart holding `product`, whose price or existence changed"""
+    user_ids = CartItem.objects.filter(product=product).values_list('cart__user_id', flat=True)
+    cache.delete_many([_summary_key(user_id) for user_id in user_ids])
+
+
+def merge_session_cart(request):
+    """
+    Move the anonymous session cart into the user's database cart.
+
+    Runs in one transaction with a fixed number of queries regardless of cart
+    size: products are loaded with a single `id__in`, and quantities are
+    merged with one upsert on the (cart, product) unique constraint.
+    """
+    if not request.user.is_authenticated:
+        return
+
+    session_cart = request.session.get('cart', {})
+    if not session_cart:
+        return
+
+    quantities = {}
+    for product_id, quantity in session_cart.items():
+        try:
+            quantities[int(product_id)] = int(quantity)
+        except (TypeError, ValueError):
+            continue
+
+    with transaction.atomic():
+        cart, created = Cart.objects.get_or_create(user=request.user)
+        product_ids = set(Product.objects.filter(id__in=quantities).values_list('id', flat=True))
+        existing = {}
+        if not created:
+            existing = dict(
+                CartItem.objects.select_for_update()
+                .filter(cart=cart, product_id__in=product_ids)
+                .values_list('product_id', 'quantity')
+            )
+        items = [
+            CartItem(cart=cart, product_id=product_id, quantity=existing.get(product_id, 0) + quantities[product_id])
+            for product_id in sorted(product_ids)
+            if quantities[product_id] > 0
+        ]
+        CartItem.objects.bulk_create(
+            items,
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+
+    invalidate_cart_summary(request.user)
+
+    # Clear session cart after migration
+    request.session['cart'] = {}
+    request.session.modified = True
@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .instrumentation import record_cache
+from .models import Product, ProductRelation
+
+
+CATALOG_TIMEOUT = 300
+# How long an expired entry may still be served while one request rebuilds it
+STALE_GRACE = 60
+LOCK_TIMEOUT = 10
+
+NAMESPACES = ('product', 'related', 'listing', 'facets', 'landing', 'pages', 'offers')
+
+cache = caches['catalog']
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(event):
+    with _stats_lock:
+        _stats[event] += 1
+    record_cache(hit=event != 'misses')
+
+
+def catalog_stats():
+    """Hit/miss/stale counters for this process since start (or the last reset)"""
+    with _stats_lock:
+        return {event: _stats[event] for event in ('hits', 'misses', 'stale')}
+
+
+def reset_catalog_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _version_key(namespace):
+    return f'catalog:{namespace}:version'
+
+
+def namespace_version(namespace):
+    """Current version of `namespace`; it changes every time the namespace is invalidated"""
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Seed from the clock so an evicted version can never resurrect older entries
+        version = int(time.time() * 1000)
+        if not cache.add(_version_key(namespace), version, None):
+            version = cache.get(_version_key(namespace), version)
+    return version
+
+
+def catalog_key(namespace, name):
+    return f'catalog:{namespace}:v{namespace_version(namespace)}:{name}'
+
+
+def cached(namespace, name, builder, timeout=CATALOG_TIMEOUT):
+    """
+    Read-through cache for catalog data.
+
+    Entries carry a soft expiry. Once it passes, the first request to take the
+    rebuild lock recomputes the value while everyone else keeps getting the
+    stale copy; a cold miss waits briefly for whoever holds the lock.
+    """
+    key = catalog_key(namespace, name)
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+
+    if entry is not None and entry['expires'] > time.time():
+        _count('hits')
+        return entry['value']
+    owns_lock = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    if not owns_lock:
+        if entry is not None:
+            _count('stale')
+            return entry['value']
+        for _ in range(20):
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                _count('hits')
+                return entry['value']
+
+    _count('misses')
+    try:
+        value = builder()
+        cache.set(key, {'value': value, 'expires': time.time() + timeout}, timeout + STALE_GRACE)
+    finally:
+        # A caller that gave up waiting must leave the holder's lock alone, or a third rebuild could start
+        if owns_lock:
+            cache.delete(lock_key)
+    return value
+
+
+def invalidate(*namespaces):
+    """Bump namespace versions so every key in them is dropped at once"""
+    for namespace in namespaces or NAMESPACES:
+        try:
+            cache.incr(_version_key(namespace))
+        except ValueError:
+            cache.set(_version_key(namespace), int(time.time() * 1000), None)
+
+
+def _category_namespace(category_key):
+    # Versions related lists per category, so an edit reaches the same-category fallback lists too
+    return f"category:{hashlib.md5((category_key or '').encode('utf-8')).hexdigest()}"
+
+
+def invalidate_stock(product_ids):
+    """
+    Drop the cached rows of products whose stock changed. Their pages are keyed
+    by updated_at, which the stock UPDATEs bump, and nothing else cached shows
+    stock, so checkouts and payments leave listings, facets and pages alone.
+    """
+    cache.delete_many([catalog_key('product', product_id) for product_id in product_ids])
+
+
+def invalidate_products(product_ids):
+    """
+    Drop cached data showing the given products after an edit (price, name,
+    category, image): their rows, the related lists of their category and of
+    products recommending them, and the counts and landing picks that
+    aggregate over the catalogue. Product pages follow on their own, being
+    keyed by what they show.
+    """
+    product_ids = list(product_ids)
+    cache.delete_many([catalog_key('product', product_id) for product_id in product_ids])
+    categories = Product.objects.filter(
+        Q(id__in=product_ids) | Q(relations__related_id__in=product_ids)
+    ).values_list('category_key', flat=True).distinct()
+    invalidate('listing', 'facets', 'landing', *[_category_namespace(key) for key in categories])
+
+
+def invalidate_catalogue():
+    """Drop every cached catalogue entry at once, for bulk edits such as imports and deletions"""
+    invalidate('product', 'related', 'listing', 'facets', 'landing', 'pages')
+
+
+def cached_listing_count(name, builder):
+    return cached('listing', name, builder)
+
+
+def get_product(product_id):
+    """Cached product lookup; returns None for unknown ids"""
+    return cached('product', product_id, lambda: Product.objects.filter(id=product_id).first())
+
+
+def get_related_products(product, limit=4):
+    """Top entries of the precomputed recommendation index, or same-category products until it's built"""
+    def build():
+        relations = (
+            ProductRelation.objects.filter(product_id=product.id)
+            .select_related('related').order_by('-score')[:limit]
+        )
+        related = [relation.related for relation in relations]
+        if related:
+            return related
+        return list(Product.objects.filter(category_key=product.category_key).exclude(id=product.id)[:limit])
+
+    return cached('related', f'{product.id}:{namespace_version(_category_namespace(product.category_key))}', build)
+
+
+def get_categories():
+    return cached(
+        'facets', 'categories',
+        lambda: list(Product.objects.order_by('category').values_list('category', flat=True).distinct()),
+    )
+
+
+def get_featured_products(categories):
+    """First product (by name) with an image in each of `categories`, from a single window query"""
+    def build():
+        keys = [Product.normalize_key(category) for category in categories]
+        picks = (
+            Product.objects
+            .filter(category_key__in=keys)
+            .exclude(image_url__isnull=True)
+            .exclude(image_url__exact='')
+            .annotate(pick=Window(RowNumber(), partition_by=F('category_key'), order_by=[F('name').asc(), F('id').asc()]))
+            .filter(pick=1)
+        )
+        by_category = {product.category_key: product for product in picks}
+        return [by_category[key] for key in keys if key in by_category]
+
+    return cached('landing', 'featured:' + ','.join(categories), build)
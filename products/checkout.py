@@ -0,0 +1,124 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .cart import invalidate_cart_summary
+from .catalog import invalidate_stock
+from .models import CartItem, Order, OrderItem, Product
+import secrets
+
+
+# How long an unpaid order holds its stock before release_expired_reservations cancels it
+RESERVATION_MINUTES = 30
+# The payment page is only opened while at least this much of the reservation is left
+PAYMENT_WINDOW = timedelta(minutes=10)
+
+
+class CheckoutError(Exception):
+    """Raised when an order can't be placed; the message is safe to show the shopper"""
+
+
+def per_product(quantities):
+    """A `CASE id WHEN ...` expression giving each product's quantity from a {product_id: quantity} map, for set-based stock UPDATEs"""
+    return Case(
+        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=Value(0),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def place_order(user, shipping, offer=None):
+    """
+    Turn the user's cart into a pending order, less `offer` (an ActiveOffer) if given.
+
+    Product rows are locked in id order so concurrent checkouts can't
+    deadlock, the ordered quantities are moved into `reserved_stock`, and all
+    order lines are written with one bulk insert. Everything happens in a
+    single transaction, so a failure leaves the cart and stock untouched.
+    """
+    with transaction.atomic():
+        lines = dict(CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity'))
+        if not lines:
+            raise CheckoutError("Your cart is empty.")
+
+        products = list(Product.objects.select_for_update().filter(id__in=lines).order_by('id'))
+        for product in products:
+            if lines[product.id] > product.available_stock:
+                raise CheckoutError(
+                    f"Sorry, only {product.available_stock} units of {product.name} are available."
+                )
+
+        # The stock condition is re-checked in SQL so backends without row locks can't oversell either
+        reserved = Product.objects.filter(
+            id__in=lines,
+            stock__gte=F('reserved_stock') + per_product(lines),
+        ).update(reserved_stock=F('reserved_stock') + per_product(lines), updated_at=timezone.now())
+        if reserved != len(products) or len(products) != len(lines):
+            raise CheckoutError("Some items in your cart are no longer available.")
+
+        subtotal = sum((product.price * lines[product.id] for product in products), Decimal('0.00'))
+        discount = offer.discount_on(subtotal) if offer else Decimal('0.00')
+        order = Order.objects.create(
+            user=user,
+            reference=f"PS-{secrets.token_hex(8).upper()}",
+            total_amount=subtotal - discount,
+            offer_id=offer.id if offer else None,
+            offer_code=offer.code if offer else '',
+            discount_amount=discount,
+            **shipping,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=lines[product.id], price=product.price)
+            for product in products
+        ])
+        CartItem.objects.filter(cart__user=user).delete()
+
+    invalidate_cart_summary(user)
+    invalidate_stock(lines)
+    return order
+
+
+def release_order_stock(order):
+    """Cancel a pending order and hand its reserved units back; returns False if it wasn't pending"""
+    with transaction.atomic():
+        if not Order.objects.filter(id=order.id, status='pending').update(status='cancelled'):
+            return False
+        quantities = {}
+        for product_id, quantity in order.items.values_list('product_id', 'quantity'):
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        Product.objects.filter(
+            id__in=quantities,
+            reserved_stock__gte=per_product(quantities),
+        ).update(reserved_stock=F('reserved_stock') - per_product(quantities), updated_at=timezone.now())
+    invalidate_stock(quantities)
+    order.status = 'cancelled'
+    return True
+
+
+def reservation_window():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', RESERVATION_MINUTES))
+
+
+def reservation_expiring(order):
+    """Whether `order`'s reservation runs out before a payment started now could finish"""
+    return order.created_at + reservation_window() - PAYMENT_WINDOW <= timezone.now()
+
+
+def release_expired_reservations(max_age=None):
+    """
+    Cancel pending orders older than `max_age` (a timedelta, defaulting to
+    settings.STOCK_RESERVATION_MINUTES) so abandoned payments stop holding
+    stock; returns how many were released.
+
+    Each order goes through release_order_stock, whose compare-and-set on
+    status='pending' means a payment landing at the same moment either wins
+    outright or finds the order already cancelled.
+    """
+    if max_age is None:
+        max_age = reservation_window()
+    expired = Order.objects.filter(status='pending', created_at__lt=timezone.now() - max_age).order_by('created_at')
+    return sum(release_order_stock(order) for order in expired.iterator())
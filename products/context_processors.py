@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cart import get_cart_summary
+
+
+def cart_summary(request):
+    """Expose the cart badge data to every template, evaluated only when rendered"""
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_summary(request))}
@@ -0,0 +1,135 @@
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Min, Q
+
+from .catalog import cached
+from .models import Product
+from .search import search_products
+
+
+# (lower, upper) price bounds in Naira; upper is exclusive and None means open-ended
+DEFAULT_PRICE_BUCKETS = (
+    (None, 10000),
+    (10000, 50000),
+    (50000, 200000),
+    (200000, None),
+)
+
+
+def price_buckets():
+    return getattr(settings, 'PRODUCT_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+
+
+def _bucket_label(lower, upper):
+    if lower is None:
+        return f'Under ₦{upper:,}'
+    if upper is None:
+        return f'₦{lower:,} and above'
+    return f'₦{lower:,} – ₦{upper:,}'
+
+
+def _bucket_q(lower, upper):
+    condition = Q()
+    if lower is not None:
+        condition &= Q(price__gte=lower)
+    if upper is not None:
+        condition &= Q(price__lt=upper)
+    return condition
+
+
+def _grouped(queryset, key, label):
+    rows = (
+        queryset.order_by()
+        .exclude(**{key: ''})
+        .values(key)
+        .annotate(label=Min(label), count=Count('id'))
+        .order_by('label')
+    )
+    return [{'key': row[key], 'label': row['label'], 'count': row['count']} for row in rows]
+
+
+def _price_counts(queryset):
+    buckets = price_buckets()
+    counts = queryset.order_by().aggregate(**{
+        f'bucket_{index}': Count('id', filter=_bucket_q(lower, upper))
+        for index, (lower, upper) in enumerate(buckets)
+    })
+    return [
+        {
+            'label': _bucket_label(lower, upper),
+            'min': lower,
+            # The max_price filter is inclusive, so links stop a kobo short of the next bucket
+            'max': None if upper is None else Decimal(upper) - Decimal('0.01'),
+            'count': counts[f'bucket_{index}'],
+        }
+        for index, (lower, upper) in enumerate(buckets)
+    ]
+
+
+class FacetSet:
+    """
+    Category, subcategory and price-bucket counts for a filtered listing.
+
+    Counts are taken over the catalog narrowed by `query`, with every active
+    filter applied except the facet's own, so the options next to a selected
+    category still show what picking another one would return. Each facet is
+    one grouped query, and the result is cached per filter signature in the
+    catalog 'facets' namespace, which product edits and imports invalidate
+    (stock changes don't move any count).
+    """
+
+    def __init__(self, query='', category='', subcategory='', min_price=None, max_price=None):
+        self.query = query
+        self.category_key = Product.normalize_key(category)
+        self.subcategory_key = Product.normalize_key(subcategory)
+        self.min_price = min_price
+        self.max_price = max_price
+
+    def filters(self):
+        filters = {}
+        if self.category_key:
+            filters['category'] = Q(category_key=self.category_key)
+        if self.subcategory_key:
+            filters['subcategory'] = Q(subcategory_key=self.subcategory_key)
+        if self.min_price is not None or self.max_price is not None:
+            price = Q()
+            if self.min_price is not None:
+                price &= Q(price__gte=self.min_price)
+            if self.max_price is not None:
+                price &= Q(price__lte=self.max_price)
+            filters['price'] = price
+        return filters
+
+    def signature(self):
+        parts = (self.query, self.category_key, self.subcategory_key, self.min_price, self.max_price)
+        return hashlib.md5(repr(parts).encode()).hexdigest()
+
+    def _excluding(self, facet):
+        queryset = Product.objects.all()
+        if self.query:
+            queryset = search_products(queryset, self.query)
+        for name, condition in self.filters().items():
+            if name != facet:
+                queryset = queryset.filter(condition)
+        return queryset
+
+    def build(self):
+        return {
+            'categories': _grouped(self._excluding('category'), 'category_key', 'category'),
+            'subcategories': _grouped(self._excluding('subcategory'), 'subcategory_key', 'subcategory'),
+            'prices': _price_counts(self._excluding('price')),
+        }
+
+    def counts(self):
+        return cached('facets', f'counts:{self.signature()}', self.build)
+
+
+def parse_price(value):
+    """Price filter value from the query string, or None when missing or invalid"""
+    try:
+        price = Decimal(value)
+    except (ArithmeticError, TypeError, ValueError):
+        return None
+    return price if price.is_finite() else None
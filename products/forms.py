@@ -6,7 +6,7 @@ from .models import Product, Profile
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
-        fields = ['name', 'price', 'stock', 'image_url', 'category', 'subcategory', 'description']
+        fields = ['sku', 'name', 'price', 'stock', 'image_url', 'category', 'subcategory', 'description']
 
 class UserRegisterForm(UserCreationForm):
     email = forms.EmailField(required=True)
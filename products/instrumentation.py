@@ -0,0 +1,157 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+# view name -> max queries per request, filled in by @query_budget
+QUERY_BUDGETS = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its declared budget while budgets are enforced"""
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook: counts and times every query of the request
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+
+def current_metrics():
+    """Metrics of the request being handled on this thread, or None outside a request"""
+    return _current.get()
+
+
+def record_cache(hit):
+    metrics = _current.get()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose top-level renders count towards the request's template time"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run per request; enforced when QUERY_BUDGETS_ENFORCED is on"""
+    def decorator(view):
+        QUERY_BUDGETS[f'{view.__module__}.{view.__name__}'] = limit
+        # functools.wraps copies the attribute onto any decorator applied on top
+        view.query_budget = limit
+        return view
+
+    return decorator
+
+
+class InstrumentationMiddleware:
+    """
+    Measure each request: query count and DB time, cache hits and misses,
+    template render time and total latency.
+
+    The numbers go out as a Server-Timing header and one JSON log line on
+    the `products.instrumentation` logger. Views decorated with
+    @query_budget are checked against their budget; an overrun is logged,
+    or raised when QUERY_BUDGETS_ENFORCED is set (as the test runner does).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total = metrics.total_time
+        if getattr(settings, 'SERVER_TIMING_HEADER', True):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+                f'tpl;dur={metrics.template_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ])
+
+        match = request.resolver_match
+        view = match.view_name if match else None
+        budget = getattr(request, 'query_budget', None)
+        over_budget = budget is not None and metrics.queries > budget
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'query_budget': budget,
+            'db_ms': round(metrics.db_time * 1000, 2),
+            'cache_hits': metrics.cache_hits,
+            'cache_misses': metrics.cache_misses,
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+        }))
+        if over_budget and getattr(settings, 'QUERY_BUDGETS_ENFORCED', False):
+            raise QueryBudgetExceeded(
+                f"{view or request.path} ran {metrics.queries} queries, over its budget of {budget}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...recommendations import build_relations, refresh_relations
+
+
+class Command(BaseCommand):
+    help = "Rebuild the related-products index from co-purchases and category similarity"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every product instead of only those changed since the last run")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['full']:
+            processed = build_relations(chunk_size=options['chunk_size'])
+        else:
+            processed = refresh_relations(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Rebuilt relations for {processed} product(s) in {time.perf_counter() - started:.2f}s")
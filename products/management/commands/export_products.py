@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...product_io import FORMATS, export_rows, guess_format
+
+
+class Command(BaseCommand):
+    help = "Stream every product to a CSV or JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="File to write, or - for stdout (default)")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension, else csv")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        rows = export_rows(fmt=fmt, chunk_size=options['chunk_size'])
+        if path == '-':
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
+            return
+        try:
+            with open(path, 'w', encoding='utf-8', newline='') as stream:
+                stream.writelines(rows)
+        except OSError as e:
+            raise CommandError(f"Could not write {path}: {e}")
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...product_io import FORMATS, ImportFormatError, guess_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Upsert products by SKU from a CSV or JSONL file, streaming it in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or - for stdin")
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the file extension, else csv")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate and count without writing")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        try:
+            if path == '-':
+                result = import_products(sys.stdin, fmt, options['batch_size'], options['dry_run'])
+            else:
+                with open(path, encoding='utf-8', newline='') as stream:
+                    result = import_products(stream, fmt, options['batch_size'], options['dry_run'])
+        except OSError as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+
+        for line, message in result.errors:
+            self.stderr.write(f"Line {line}: {message}")
+        if result.invalid > len(result.errors):
+            self.stderr.write(f"... and {result.invalid - len(result.errors)} more invalid row(s)")
+
+        prefix = "[dry run] would have " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}created {result.created}, updated {result.updated}, skipped {result.invalid} "
+            f"of {result.rows} row(s) in {result.seconds:.2f}s ({result.rows_per_second:,.0f} rows/s)"
+        ))
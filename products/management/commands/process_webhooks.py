@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...checkout import release_expired_reservations
+from ...webhooks import process_batch
+
+
+class Command(BaseCommand):
+    help = "Process queued Paystack webhook events, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Drain the due events once and exit")
+        parser.add_argument(
+            '--release-interval', type=float, default=60.0,
+            help="Seconds between sweeps that release stock held by expired unpaid orders (0 disables)",
+        )
+
+    def handle(self, *args, **options):
+        last_release = None
+        while True:
+            processed = process_batch(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} event(s)")
+                continue
+            # Sweep while idle, after the queue is drained, so late payments for old orders get applied first
+            if options['release_interval'] and (last_release is None or time.monotonic() - last_release >= options['release_interval']):
+                released = release_expired_reservations()
+                if released:
+                    self.stdout.write(f"Released {released} expired reservation(s)")
+                last_release = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...checkout import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "Cancel unpaid orders past their reservation window and put their stock back on sale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, help="Reservation window; defaults to settings.STOCK_RESERVATION_MINUTES")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(minutes=options['minutes']) if options['minutes'] is not None else None
+        released = release_expired_reservations(max_age)
+        self.stdout.write(f"Released {released} expired reservation(s)")
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:21
+
+from django.db import migrations, models
+
+
+def populate_category_keys(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    # One UPDATE per distinct (category, subcategory) pair rather than per product
+    pairs = Product.objects.order_by().values_list('category', 'subcategory').distinct()
+    for category, subcategory in list(pairs):
+        products = Product.objects.filter(category=category)
+        if subcategory is None:
+            products = products.filter(subcategory__isnull=True)
+        else:
+            products = products.filter(subcategory=subcategory)
+        products.update(
+            category_key=(category or '').strip().casefold(),
+            subcategory_key=(subcategory or '').strip().casefold(),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_webhookevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='subcategory_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(populate_category_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_key', 'subcategory_key'], name='product_category_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_key', 'name'], name='product_category_name_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:43
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_relation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='discount_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='offer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='products.offer'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='offer_code',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+class PostgresRunSQL(migrations.RunSQL):
+    """RunSQL that only runs on PostgreSQL; other backends build their search index elsewhere"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_order_indexes'),
+    ]
+
+    # A generated column keeps the vector in sync on every insert/update, including
+    # bulk writes that bypass model signals. PostgreSQL won't alter the type of a
+    # column the vector reads from, so an AlterField on name, description, category
+    # or subcategory has to drop and re-add it around the change.
+    operations = [
+        PostgresRunSQL(
+            sql=[
+                "ALTER TABLE products_product ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                "GENERATED ALWAYS AS ("
+                "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+                "setweight(to_tsvector('english', coalesce(category, '') || ' ' || coalesce(subcategory, '')), 'B') || "
+                "setweight(to_tsvector('english', coalesce(description, '')), 'C')"
+                ") STORED",
+                "CREATE INDEX IF NOT EXISTS products_product_search_gin ON products_product USING gin (search_vector)",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS products_product_search_gin",
+                "ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector",
+            ],
+        ),
+    ]
@@ -1,15 +1,25 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class Product(models.Model):
+    # Supplier stock-keeping unit; the natural key bulk imports upsert on
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255, db_index=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Units held by pending orders; they leave `stock` once payment is confirmed
+    reserved_stock = models.PositiveIntegerField(default=0)
     image_url = models.URLField(max_length=2000)
     category = models.CharField(max_length=100, default='General', db_index=True)
     description = models.TextField(blank=True, null=True) 
     subcategory = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    # Casefolded copies of category/subcategory so filters are plain indexed equality lookups
+    category_key = models.CharField(max_length=100, default='', editable=False)
+    subcategory_key = models.CharField(max_length=100, default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
     
@@ -18,10 +28,31 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=['category', 'subcategory']),
             models.Index(fields=['price']),
+            models.Index(fields=['category_key', 'subcategory_key'], name='product_category_key_idx'),
+            models.Index(fields=['category_key', 'name'], name='product_category_name_idx'),
         ]
     
     def __str__(self):
         return self.name  
+    
+    @staticmethod
+    def normalize_key(value):
+        return (value or '').strip().casefold()
+    
+    def normalize_keys(self):
+        self.category_key = self.normalize_key(self.category)
+        self.subcategory_key = self.normalize_key(self.subcategory)
+    
+    def save(self, *args, **kwargs):
+        self.normalize_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'category', 'subcategory'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'category_key', 'subcategory_key'}
+        super().save(*args, **kwargs)
+    
+    @property
+    def available_stock(self):
+        return max(self.stock - self.reserved_stock, 0)
 
 class Offer(models.Model):
     code = models.CharField(max_length=50, unique=True, db_index=True)
@@ -58,11 +89,18 @@ class Order(models.Model):
         ('shipped', 'Shipped'),
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
+        # Paid after it was cancelled, with the stock gone; the charge needs refunding
+        ('refund_due', 'Refund due'),
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    # No index of its own: order_user_created_idx starts with user_id and serves every user lookup
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_index=False)
     reference = models.CharField(max_length=100, unique=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    # Promo applied at checkout; the code and amount are kept even if the offer is later deleted
+    offer = models.ForeignKey(Offer, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    offer_code = models.CharField(max_length=50, blank=True, default='')
+    discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -74,6 +112,12 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # A shopper's history, newest first, in keyset order
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            # Admin and fulfilment lists filtered by status, by date
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
     
     def __str__(self):
         return f"Order {self.reference} - {self.user.username}"
@@ -90,6 +134,14 @@ class OrderItem(models.Model):
     
     def get_total(self):
         return self.quantity * self.price
+    
+    @staticmethod
+    def line_total(prefix=''):
+        """quantity × price paid as an exact Decimal SQL expression; `prefix` reaches lines through a relation"""
+        return models.ExpressionWrapper(
+            models.F(f'{prefix}quantity') * models.F(f'{prefix}price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
 
 
 class Cart(models.Model):
@@ -101,10 +153,11 @@ class Cart(models.Model):
         return f"Cart for {self.user.username}"
     
     def get_total(self):
-        return sum(item.get_total() for item in self.items.all())
+        total = self.items.aggregate(total=models.Sum(CartItem.line_total()))['total']
+        return total if total is not None else Decimal('0.00')
     
     def get_item_count(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.items.aggregate(count=models.Sum('quantity'))['count'] or 0
 
 
 class CartItem(models.Model):
@@ -120,4 +173,63 @@ class CartItem(models.Model):
         return f"{self.quantity}x {self.product.name}"
     
     def get_total(self):
-        return self.quantity * self.product.price
\ No newline at end of file
+        return self.quantity * self.product.price
+    
+    @staticmethod
+    def line_total(prefix=''):
+        """quantity × product price as an exact Decimal SQL expression; `prefix` reaches lines through a relation"""
+        return models.ExpressionWrapper(
+            models.F(f'{prefix}quantity') * models.F(f'{prefix}product__price'),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+class WebhookEvent(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    # Paystack resends the same event on retries; this key makes redelivery a no-op
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id}) - {self.status}"
+
+
+class ProductRelation(models.Model):
+    """Precomputed "related products" edge, rebuilt offline by `manage.py build_recommendations`"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='relations')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    # Paid orders that contained both products
+    co_purchases = models.PositiveIntegerField(default=0)
+    # Start of the build that wrote the row; the next incremental build looks for changes after it
+    computed_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_product_relation'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-score'], name='product_relation_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.2f})"
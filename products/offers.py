@@ -0,0 +1,109 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .catalog import cached, namespace_version
+from .models import Offer
+
+
+SESSION_KEY = 'offer_code'
+CENT = Decimal('0.01')
+
+
+class OfferError(ValueError):
+    """The promo code is unknown, inactive or expired"""
+
+
+@dataclass(frozen=True)
+class ActiveOffer:
+    id: int
+    code: str
+    description: str
+    discount: Decimal
+    expires_at: datetime = None
+
+    def discount_on(self, amount):
+        """Money off `amount` (a percentage, rounded to the kobo and never more than the amount)"""
+        return min((amount * self.discount / 100).quantize(CENT, rounding=ROUND_HALF_UP), amount)
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+def _load_offers():
+    """Active offers that haven't expired yet; shared through the catalog cache"""
+    offers = Offer.objects.filter(is_active=True).filter(Q(expires_at__isnull=True) | Q(expires_at__gt=timezone.now()))
+    return [
+        ActiveOffer(offer.id, offer.code, offer.description, offer.discount, offer.expires_at)
+        for offer in offers
+    ]
+
+
+class _OfferTable:
+    """
+    Per-process map of code -> ActiveOffer.
+
+    It is recompiled from the shared cached list when the 'offers' namespace
+    version moves (any Offer save or delete) and when the earliest expiry in
+    it passes, so a lookup costs one cache read for the version and a dict
+    access, never a query.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.valid_until = None
+        self.offers = {}
+
+    def current(self):
+        version = namespace_version('offers')
+        now = timezone.now()
+        if version != self.version or (self.valid_until is not None and now >= self.valid_until):
+            with self.lock:
+                self.compile(version, now)
+        return self.offers
+
+    def compile(self, version, now):
+        live = [offer for offer in cached('offers', 'active', _load_offers) if offer.expires_at is None or offer.expires_at > now]
+        self.offers = {normalize_code(offer.code): offer for offer in live}
+        self.valid_until = min((offer.expires_at for offer in live if offer.expires_at), default=None)
+        self.version = version
+
+
+_table = _OfferTable()
+
+
+def active_offers():
+    return _table.current()
+
+
+def get_offer(code):
+    """The active offer for `code`, matched case-insensitively; raises OfferError"""
+    offer = active_offers().get(normalize_code(code))
+    if offer is None:
+        raise OfferError(f"'{code}' is not a valid promo code.")
+    return offer
+
+
+def apply_offer(pricing, offer):
+    """Set the discount of a CartPricing from `offer` (None clears it) and return it"""
+    pricing.offer = offer
+    pricing.discount = offer.discount_on(pricing.total) if offer else Decimal('0.00')
+    return pricing
+
+
+def session_offer(request):
+    """The offer saved on the session, dropping the code if it has stopped being valid"""
+    code = request.session.get(SESSION_KEY)
+    if not code:
+        return None
+    try:
+        return get_offer(code)
+    except OfferError:
+        del request.session[SESSION_KEY]
+        return None
@@ -0,0 +1,275 @@
+import datetime
+import hashlib
+import math
+from collections.abc import Sequence
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class KeysetPage(Sequence):
+    """A page of results with opaque cursors for the neighbouring pages"""
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f'<KeysetPage {self.number} of {self.paginator.num_pages}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    @cached_property
+    def next_cursor(self):
+        if not self._has_next or not self.paginator.seekable:
+            return ''
+        return self.paginator.encode_cursor(self.object_list[-1], 'next', self.number + 1)
+
+    @cached_property
+    def previous_cursor(self):
+        if not self._has_previous or not self.paginator.seekable:
+            return ''
+        return self.paginator.encode_cursor(self.object_list[0], 'previous', self.number - 1)
+
+
+class KeysetPaginator:
+    """
+    Paginates an ordered queryset by seeking past the last row seen instead of
+    using OFFSET. The queryset's ordering is made unique by appending the
+    primary key, and totals come from a cached COUNT per filter signature.
+
+    Orderings on annotations (e.g. search rank) can't be seeked reliably, so
+    those fall back to OFFSET pages.
+    """
+
+    cursor_salt = 'products.pagination.cursor'
+
+    def __init__(self, queryset, per_page, count_timeout=300, count_cache=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_timeout = count_timeout
+        # Optional `count_cache(name, builder)` read-through hook, e.g. to share invalidation with other cached data
+        self.count_cache = count_cache
+        self.ordering = self._unique_ordering(queryset)
+        field_names = {field.name for field in queryset.model._meta.concrete_fields}
+        self.seekable = all(field.lstrip('-') in field_names for field in self.ordering)
+
+    @staticmethod
+    def _unique_ordering(queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(field.lstrip('-') in ('pk', pk_name) for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f'-{pk_name}' if descending else pk_name)
+        return ordering
+
+    @cached_property
+    def count(self):
+        if self.queryset.query.is_empty():
+            return 0
+        signature = hashlib.md5(str(self.queryset.query).encode('utf-8')).hexdigest()
+        key = f'{self.queryset.model._meta.label_lower}_count_{signature}'
+        if self.count_cache is not None:
+            return self.count_cache(key, self.queryset.count)
+        count = cache.get(key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(key, count, self.count_timeout)
+        return count
+
+    @cached_property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def encode_cursor(self, obj, direction, number):
+        values = [getattr(obj, field.lstrip('-')) for field in self.ordering]
+        return signing.dumps(
+            {'ordering': self.ordering, 'values': values, 'direction': direction, 'page': number},
+            salt=self.cursor_salt,
+            serializer=_CursorSerializer,
+            compress=True,
+        )
+
+    def decode_cursor(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=self.cursor_salt, serializer=_CursorSerializer)
+        except signing.BadSignature:
+            return None
+        # A cursor only means something for the ordering it was taken from (another sort, another list)
+        if data.get('ordering') != self.ordering or len(data.get('values', [])) != len(self.ordering):
+            return None
+        return data
+
+    def _seek_filter(self, values, reverse):
+        """Build `(a, b, id) > (x, y, z)` as nested ORs, honouring each field's direction"""
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            ascending = not field.startswith('-')
+            if reverse:
+                ascending = not ascending
+            lookup = 'gt' if ascending else 'lt'
+            condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def get_page(self, cursor=None, page=None):
+        """
+        Return the page after/before `cursor`. Without a cursor, a `page` number
+        is honoured as a compatibility fallback for old `?page=` links.
+        """
+        data = self.decode_cursor(cursor) if cursor and self.seekable else None
+        if data is not None:
+            try:
+                number = max(1, int(data.get('page', 1)))
+                if data.get('direction') == 'previous':
+                    return self._page_before(data['values'], number)
+                return self._page_after(data['values'], number)
+            except (TypeError, ValueError, ValidationError):
+                # Values that don't fit the fields' types; treat it like no cursor at all
+                pass
+
+        try:
+            number = int(page) if page != 'last' else self.num_pages
+        except (TypeError, ValueError):
+            number = 1
+        number = min(max(number, 1), self.num_pages)
+
+        if not self.seekable:
+            return self._offset_page(number)
+        if number == 1:
+            return self._page_after(None, 1)
+        if number == self.num_pages and self.count > (number - 1) * self.per_page:
+            return self._last_page(number)
+        return self._offset_page(number)
+
+    def _page_after(self, values, number):
+        queryset = self.queryset.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, reverse=False))
+        rows = list(queryset[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], number, self, len(rows) > self.per_page, number > 1)
+
+    def _page_before(self, values, number):
+        queryset = self.queryset.order_by(*self._reversed_ordering())
+        queryset = queryset.filter(self._seek_filter(values, reverse=True))
+        rows = list(queryset[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, number if has_previous else 1, self, True, has_previous)
+
+    def _last_page(self, number):
+        # Read the tail backwards rather than skipping over every earlier row
+        size = self.count - (number - 1) * self.per_page
+        rows = list(self.queryset.order_by(*self._reversed_ordering())[:size])[::-1]
+        return KeysetPage(rows, number, self, False, number > 1)
+
+    def _offset_page(self, number):
+        bottom = (number - 1) * self.per_page
+        rows = list(self.queryset.order_by(*self.ordering)[bottom:bottom + self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], number, self, len(rows) > self.per_page, number > 1)
+
+
+def estimate_count(queryset):
+    """
+    Row count from the database's table statistics, or None.
+
+    Only unfiltered querysets can be estimated, and only on backends that keep
+    statistics (PostgreSQL's reltuples, MySQL's table_rows, SQLite's
+    sqlite_stat1 after ANALYZE).
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    sql = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [connection.ops.quote_name(table)]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+        'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+    }.get(connection.vendor)
+    if sql is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*sql)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    try:
+        # sqlite_stat1 stores "rows avg-per-key ..." as text
+        estimate = int(str(row[0]).split()[0])
+    except ValueError:
+        return None
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that trusts table statistics for large unfiltered lists.
+
+    COUNT(*) over a big table is a full scan on PostgreSQL, paid on every admin
+    changelist page. Below `exact_below` rows, or whenever the list is
+    filtered, the exact count is used instead.
+    """
+
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        estimate = None
+        if hasattr(self.object_list, 'query'):
+            estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.exact_below:
+            return estimate
+        return super().count
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds past the millisecond, which would make seeks skip rows
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _CursorSerializer:
+    def dumps(self, obj):
+        return _CursorEncoder(separators=(',', ':')).encode(obj).encode('latin-1')
+
+    def loads(self, data):
+        return signing.JSONSerializer().loads(data)
@@ -0,0 +1,91 @@
+import logging
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .catalog import invalidate_stock
+from .checkout import per_product
+from .models import Order, OrderItem, Product
+
+
+logger = logging.getLogger(__name__)
+
+
+def _order_quantities(reference):
+    quantities = {}
+    for product_id, quantity in OrderItem.objects.filter(order__reference=reference).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def mark_order_paid(reference):
+    """
+    Flip a pending order to paid and take its units out of stock.
+
+    The status change is a compare-and-set on status='pending', so repeated
+    webhooks or a webhook racing verify_payment fulfil the order exactly once;
+    later calls cost a single no-op UPDATE and return False.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(reference=reference, status='pending').update(
+            status='paid', updated_at=timezone.now()
+        ):
+            return False
+
+        quantities = _order_quantities(reference)
+        if quantities:
+            # One set-based UPDATE; rows without enough stock are left alone, as before
+            Product.objects.filter(id__in=quantities, stock__gte=per_product(quantities)).update(
+                stock=F('stock') - per_product(quantities),
+                reserved_stock=Greatest(F('reserved_stock') - per_product(quantities), Value(0)),
+                updated_at=timezone.now(),
+            )
+    invalidate_stock(quantities)
+    return True
+
+
+def reclaim_cancelled_order(reference):
+    """
+    Fulfil a cancelled order after all, when its payment arrived after the
+    reservation expired; returns False unless every line is still in stock.
+
+    The units come straight out of unreserved stock in one conditional
+    UPDATE, and the order only flips to paid if every product row took them.
+    """
+    with transaction.atomic():
+        if not Order.objects.filter(reference=reference, status='cancelled').update(
+            status='paid', updated_at=timezone.now()
+        ):
+            return False
+        quantities = _order_quantities(reference)
+        taken = Product.objects.filter(
+            id__in=quantities,
+            stock__gte=F('reserved_stock') + per_product(quantities),
+        ).update(stock=F('stock') - per_product(quantities), updated_at=timezone.now())
+        if not quantities or taken != len(quantities):
+            transaction.set_rollback(True)
+            return False
+    invalidate_stock(quantities)
+    return True
+
+
+def settle_payment(reference):
+    """
+    Apply a successful charge for `reference` and return the order's status
+    afterwards, or None if there's no such order.
+
+    A pending order is fulfilled as usual. One that was cancelled in the
+    meantime (its reservation expired while the shopper was paying) is
+    fulfilled if the stock is still there, and otherwise marked refund_due
+    and logged, so the charge is never silently dropped.
+    """
+    if mark_order_paid(reference) or reclaim_cancelled_order(reference):
+        return 'paid'
+    if Order.objects.filter(reference=reference, status='cancelled').update(
+        status='refund_due', updated_at=timezone.now()
+    ):
+        logger.error("Order %s was paid after it was cancelled and is out of stock; refund due", reference)
+        return 'refund_due'
+    return Order.objects.filter(reference=reference).values_list('status', flat=True).first()
@@ -0,0 +1,174 @@
+import http.client
+import json
+import queue
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class PaystackError(Exception):
+    """The Paystack API couldn't be reached or returned an unusable response"""
+
+
+class CircuitOpenError(PaystackError):
+    """Calls are being short-circuited after repeated failures"""
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of keep-alive HTTP(S) connections to one host"""
+
+    def __init__(self, base_url, size=4, timeout=5.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_connection()
+
+    def release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and lets one trial call through after `cooldown` seconds"""
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Half-open: the next result decides whether the circuit closes again
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class PaystackGateway:
+    """Process-wide Paystack client with pooled connections, retries, a circuit breaker and a result cache"""
+
+    retry_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, secret_key, base_url='https://api.paystack.co', timeout=5.0, max_retries=2,
+                 pool_size=4, breaker_threshold=5, breaker_cooldown=30.0, cache_timeout=60, backoff=0.2):
+        self.secret_key = secret_key
+        self.max_retries = max_retries
+        self.cache_timeout = cache_timeout
+        self.backoff = backoff
+        self.pool = ConnectionPool(base_url, size=pool_size, timeout=timeout)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+
+    def _send(self, method, path):
+        connection = self.pool.acquire()
+        try:
+            connection.request(method, self.pool.base_path + path, headers={
+                'Authorization': f'Bearer {self.secret_key}',
+                'Accept': 'application/json',
+                'Connection': 'keep-alive',
+            })
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.release(connection)
+        return response.status, body
+
+    def request(self, method, path):
+        if not self.breaker.allow():
+            raise CircuitOpenError("Paystack is unavailable, try again shortly")
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, body = self._send(method, path)
+            except (OSError, http.client.HTTPException) as e:
+                error = PaystackError(f"Could not reach Paystack: {e}")
+                continue
+            if status in self.retry_statuses:
+                error = PaystackError(f"Paystack returned HTTP {status}")
+                continue
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                error = PaystackError("Paystack returned an invalid response")
+                break
+            self.breaker.record_success()
+            return payload
+
+        self.breaker.record_failure()
+        raise error
+
+    def verify_transaction(self, reference):
+        """Return Paystack's verification payload for `reference`; successful results are cached briefly"""
+        key = f'paystack_verify_{reference}'
+        payload = cache.get(key)
+        if payload is None:
+            payload = self.request('GET', f'/transaction/verify/{quote(reference, safe="")}')
+            if payload.get('status') and (payload.get('data') or {}).get('status') == 'success':
+                cache.set(key, payload, self.cache_timeout)
+        return payload
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the shared gateway, built from settings on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PaystackGateway(
+                    settings.PAYSTACK_SECRET_KEY,
+                    base_url=settings.PAYSTACK_API_URL,
+                    timeout=settings.PAYSTACK_TIMEOUT,
+                    max_retries=settings.PAYSTACK_MAX_RETRIES,
+                )
+    return _gateway
@@ -0,0 +1,172 @@
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .catalog import invalidate_catalogue
+from .models import Product
+
+
+# Columns read on import and written on export, in file order
+FIELDS = ('sku', 'name', 'price', 'stock', 'category', 'subcategory', 'image_url', 'description')
+# Written on conflict; reserved_stock and created_at belong to the shop, not the supplier feed
+UPDATE_FIELDS = (
+    'name', 'price', 'stock', 'category', 'subcategory', 'category_key', 'subcategory_key',
+    'image_url', 'description', 'updated_at',
+)
+FORMATS = ('csv', 'jsonl')
+MAX_REPORTED_ERRORS = 50
+
+
+class ImportFormatError(ValueError):
+    """The input couldn't be read as the requested format"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    invalid: int = 0
+    errors: list = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add_error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def guess_format(filename, default='csv'):
+    for fmt in FORMATS:
+        if filename.endswith(f'.{fmt}'):
+            return fmt
+    return default
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a text stream without loading it into memory"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ImportFormatError(f"Line {line_number}: invalid JSON ({e})")
+            if not isinstance(row, dict):
+                raise ImportFormatError(f"Line {line_number}: expected a JSON object")
+            yield line_number, row
+    else:
+        raise ImportFormatError(f"Unsupported format '{fmt}'")
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def build_product(row):
+    """Validate one input row and return an unsaved Product, raising ValidationError"""
+    values = {}
+    for name in FIELDS:
+        value = row.get(name)
+        if value is None:
+            continue
+        value = str(value).strip()
+        # Empty cells fall back to the model default (or NULL) instead of failing validation
+        if value:
+            values[name] = value
+    if 'sku' not in values:
+        raise ValidationError({'sku': ["This field is required."]})
+    product = Product(**values)
+    # Uniqueness is the upsert's job; checking it per row would cost a query each
+    product.clean_fields()
+    product.normalize_keys()
+    return product
+
+
+def import_products(stream, fmt='csv', batch_size=1000, dry_run=False):
+    """
+    Upsert products from a CSV or JSONL stream, keyed by SKU.
+
+    Rows are validated and written `batch_size` at a time, each batch in its
+    own transaction with one lookup of existing SKUs and one
+    `bulk_create(update_conflicts=True)`. Invalid rows are skipped and
+    reported; when a SKU repeats within a batch the last row wins. With
+    `dry_run` nothing is written but the counts are still reported.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+
+    for batch in _batches(read_rows(stream, fmt), batch_size):
+        products = {}
+        for line_number, row in batch:
+            result.rows += 1
+            try:
+                product = build_product(row)
+            except ValidationError as e:
+                result.add_error(line_number, '; '.join(
+                    f"{name}: {' '.join(messages)}" for name, messages in e.message_dict.items()
+                ))
+                continue
+            products[product.sku] = product
+
+        if not products:
+            continue
+
+        with transaction.atomic():
+            existing = dict(Product.objects.filter(sku__in=products).values_list('sku', 'id'))
+            if not dry_run:
+                Product.objects.bulk_create(
+                    list(products.values()),
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=UPDATE_FIELDS,
+                )
+        result.updated += len(existing)
+        result.created += len(products) - len(existing)
+        if not dry_run:
+            # bulk_create skips post_save, so drop cached copies here
+            invalidate_catalogue()
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+class Echo:
+    """File-like object whose write() hands the value back, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset=None, fmt='csv', chunk_size=2000):
+    """Yield the products in `queryset` as CSV or JSONL text, one row at a time"""
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unsupported format '{fmt}'")
+    queryset = Product.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(['' if value is None else value for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(FIELDS, row)), default=str) + '\n'
+
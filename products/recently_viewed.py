@@ -0,0 +1,49 @@
+from .models import Product
+
+
+COOKIE_NAME = 'recently_viewed'
+COOKIE_SALT = 'products.recently_viewed'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+MAX_ITEMS = 10
+
+
+def get_recently_viewed(request):
+    """Product ids the visitor viewed, most recent first"""
+    if not hasattr(request, '_recently_viewed'):
+        value = request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT, max_age=COOKIE_MAX_AGE)
+        ids = []
+        for part in value.split('.'):
+            if part.isdigit() and int(part) not in ids:
+                ids.append(int(part))
+        request._recently_viewed = ids[:MAX_ITEMS]
+    return request._recently_viewed
+
+
+def record_view(request, response, product_id):
+    """
+    Move `product_id` to the front of the visitor's list.
+
+    The list lives in a signed cookie ("12.7.3"), so tracking a page view never
+    touches the session or the database; the cookie is only re-sent when the
+    order actually changes.
+    """
+    viewed = get_recently_viewed(request)
+    if viewed[:1] == [product_id]:
+        return
+    viewed = [product_id] + [pid for pid in viewed if pid != product_id][:MAX_ITEMS - 1]
+    request._recently_viewed = viewed
+    response.set_signed_cookie(
+        COOKIE_NAME, '.'.join(map(str, viewed)), salt=COOKIE_SALT,
+        max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+    )
+
+
+def forget_recently_viewed(response):
+    response.delete_cookie(COOKIE_NAME, samesite='Lax')
+
+
+def get_recent_products(request, limit=5):
+    """Recently viewed products in viewing order, skipping any that no longer exist"""
+    ids = get_recently_viewed(request)[:limit]
+    products = Product.objects.in_bulk(ids)
+    return [products[pid] for pid in ids if pid in products]
@@ -0,0 +1,170 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.utils import timezone
+
+from .catalog import invalidate
+from .models import Order, OrderItem, Product, ProductRelation
+
+
+# Orders that count as a purchase for co-purchase mining
+PURCHASED_STATUSES = ('paid', 'processing', 'shipped', 'delivered')
+RELATIONS_PER_PRODUCT = 8
+CO_PURCHASE_WEIGHT = 10.0
+CATEGORY_WEIGHT = 2.0
+SUBCATEGORY_WEIGHT = 1.0
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def co_purchase_counts(product_ids):
+    """{product_id: {other_id: orders containing both}} for the given products, from one grouped query"""
+    rows = (
+        OrderItem.objects
+        .filter(product_id__in=product_ids, order__status__in=PURCHASED_STATUSES)
+        .annotate(other_id=F('order__items__product_id'))
+        .filter(~Q(other_id=F('product_id')))
+        .values('product_id', 'other_id')
+        .annotate(orders=Count('order_id', distinct=True))
+        .order_by()
+    )
+    counts = defaultdict(dict)
+    for row in rows:
+        counts[row['product_id']][row['other_id']] = row['orders']
+    return counts
+
+
+def units_sold():
+    """{product_id: units} over purchased orders; breaks ties between equally related products"""
+    return dict(
+        OrderItem.objects.filter(order__status__in=PURCHASED_STATUSES)
+        .values('product_id').annotate(units=Sum('quantity')).order_by()
+        .values_list('product_id', 'units')
+    )
+
+
+def changed_product_ids(since):
+    """Products whose orders or own fields changed after `since`, plus any without relations yet"""
+    # Every product in a newly purchased order can gain a co-purchase edge
+    orders = Order.objects.filter(updated_at__gt=since, status__in=PURCHASED_STATUSES).values('id')
+    ordered = OrderItem.objects.filter(order__in=orders).values_list('product_id', flat=True)
+    edited = Product.objects.filter(updated_at__gt=since).values_list('id', flat=True)
+    unrelated = Product.objects.filter(relations__isnull=True).values_list('id', flat=True)
+    return set(ordered) | set(edited) | set(unrelated)
+
+
+def score_relations(product, candidates, co_purchases, sales, top_sales):
+    """Rank `candidates` for `product`; returns (score, co_purchases, candidate) tuples, best first"""
+    scored = []
+    for candidate in candidates:
+        if candidate.id == product.id:
+            continue
+        together = co_purchases.get(candidate.id, 0)
+        score = together * CO_PURCHASE_WEIGHT
+        if candidate.category_key == product.category_key:
+            score += CATEGORY_WEIGHT
+            if product.subcategory_key and candidate.subcategory_key == product.subcategory_key:
+                score += SUBCATEGORY_WEIGHT
+        if not score:
+            continue
+        # Popularity only orders otherwise equal candidates, so it stays below 1
+        score += sales.get(candidate.id, 0) / (top_sales + 1)
+        scored.append((score, together, candidate))
+    scored.sort(key=lambda item: (-item[0], item[2].id))
+    return scored[:RELATIONS_PER_PRODUCT]
+
+
+def _load_category_candidates(groups, category_keys, sales):
+    """
+    Add the best sellers of each category, and of each (category, subcategory),
+    to `groups`.
+
+    Only the top RELATIONS_PER_PRODUCT + 1 of a group can ever make a
+    product's list (one slot may be the product itself), so each group is a
+    bounded heap and memory doesn't grow with the catalogue.
+    """
+    limit = RELATIONS_PER_PRODUCT + 1
+    heaps = defaultdict(list)
+    products = Product.objects.filter(category_key__in=category_keys).only('id', 'category_key', 'subcategory_key')
+    for candidate in products.iterator(chunk_size=2000):
+        entry = (sales.get(candidate.id, 0), candidate.id, candidate)
+        keys = [candidate.category_key]
+        if candidate.subcategory_key:
+            keys.append((candidate.category_key, candidate.subcategory_key))
+        for key in keys:
+            heap = heaps[key]
+            if len(heap) < limit:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    for key in category_keys:
+        groups[key] = []
+    for key, heap in heaps.items():
+        groups[key] = [candidate for _, _, candidate in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def build_relations(product_ids=None, chunk_size=500):
+    """
+    Recompute ProductRelation rows for `product_ids` (every product when None).
+
+    Work is done `chunk_size` products at a time: one grouped co-purchase
+    query, candidates pulled from the best sellers of each product's
+    category, and the chunk's rows replaced in one transaction. Returns the
+    number of products processed.
+    """
+    if product_ids is None:
+        product_ids = Product.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    # Stamped on every row so the next incremental run picks up anything that changed while this one ran
+    started = timezone.now()
+    sales = units_sold()
+    top_sales = max(sales.values(), default=0)
+    groups = {}
+    processed = 0
+
+    for chunk in _chunks(product_ids, chunk_size):
+        products = list(Product.objects.filter(id__in=chunk).only('id', 'category_key', 'subcategory_key'))
+        counts = co_purchase_counts([product.id for product in products])
+        missing = {product.category_key for product in products} - groups.keys()
+        if missing:
+            _load_category_candidates(groups, missing, sales)
+        partners = Product.objects.in_bulk(
+            {other for product_counts in counts.values() for other in product_counts},
+        )
+
+        relations = []
+        for product in products:
+            co_purchases = counts.get(product.id, {})
+            candidates = {
+                candidate.id: candidate
+                for key in (product.category_key, (product.category_key, product.subcategory_key))
+                for candidate in groups.get(key, [])
+            }
+            candidates.update({pid: partners[pid] for pid in co_purchases if pid in partners})
+            for score, together, candidate in score_relations(product, candidates.values(), co_purchases, sales, top_sales):
+                relations.append(ProductRelation(
+                    product=product, related=candidate, score=score, co_purchases=together, computed_at=started,
+                ))
+
+        with transaction.atomic():
+            ProductRelation.objects.filter(product_id__in=[product.id for product in products]).delete()
+            ProductRelation.objects.bulk_create(relations)
+        processed += len(products)
+
+    if processed:
+        invalidate('related', 'pages')
+    return processed
+
+
+def refresh_relations(chunk_size=500):
+    """Incremental rebuild: only products affected since the last run"""
+    since = ProductRelation.objects.aggregate(last=Max('computed_at'))['last']
+    if since is None:
+        return build_relations(chunk_size=chunk_size)
+    return build_relations(sorted(changed_product_ids(since)), chunk_size=chunk_size)
@@ -0,0 +1,166 @@
+import re
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+
+SEARCH_FIELDS = ('name', 'description', 'category', 'subcategory')
+
+
+def _tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _no_matches(queryset):
+    # Still annotated, so ordering by relevance works on a query with no searchable words
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class BaseSearchBackend:
+    """Filters a product queryset by a search query and annotates `search_rank`"""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def setup(self):
+        """Create any index structures the backend needs (run after migrate)"""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class BasicSearchBackend(BaseSearchBackend):
+    """Unindexed icontains search, used when no full-text index is available"""
+
+    def search(self, queryset, query):
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Weighted tsvector column on the product table, served by a GIN index (both created by migration 0009)"""
+
+    config = 'english'
+    column = 'search_vector'
+
+    def search(self, queryset, query):
+        tokens = _tokenize(query)
+        if not tokens:
+            return _no_matches(queryset)
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        ops = self.connection.ops
+        vector = f'{ops.quote_name(Product._meta.db_table)}.{ops.quote_name(self.column)}'
+        return queryset.filter(
+            RawSQL(f'{vector} @@ to_tsquery(%s, %s)', (self.config, tsquery), output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank({vector}, to_tsquery(%s, %s))', (self.config, tsquery), output_field=FloatField())
+        )
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 shadow table over the product table, kept in sync by triggers"""
+
+    table = 'products_product_fts'
+    # bm25 column weights, in SEARCH_FIELDS order
+    weights = (10.0, 2.0, 5.0, 5.0)
+    # (alias, database name) -> whether the FTS table exists
+    _available = {}
+
+    def setup(self):
+        source = Product._meta.db_table
+        columns = ', '.join(SEARCH_FIELDS)
+        new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+        old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+        delete_old = (
+            f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values});"
+        )
+        insert_new = f"INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new_values});"
+
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [self.table])
+            exists = cursor.fetchone() is not None
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+                    f"{columns}, content='{source}', content_rowid='id', tokenize='porter unicode61')"
+                )
+            except DatabaseError:
+                # SQLite built without FTS5; searches fall back to BasicSearchBackend
+                return
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ai AFTER INSERT ON {source} BEGIN {insert_new} END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_ad AFTER DELETE ON {source} BEGIN {delete_old} END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {self.table}_au AFTER UPDATE OF {columns} ON {source} "
+                f"BEGIN {delete_old} {insert_new} END"
+            )
+            if not exists:
+                cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+        self._available[(self.using, str(self.connection.settings_dict['NAME']))] = True
+
+    def available(self):
+        key = (self.using, str(self.connection.settings_dict['NAME']))
+        # Only a positive answer is remembered: a search before migrate mustn't disable FTS for the process
+        if not self._available.get(key):
+            with self.connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [self.table])
+                self._available[key] = cursor.fetchone() is not None
+        return self._available[key]
+
+    def search(self, queryset, query):
+        if not self.available():
+            return BasicSearchBackend(self.using).search(queryset, query)
+        tokens = _tokenize(query)
+        if not tokens:
+            return _no_matches(queryset)
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(weight) for weight in self.weights)
+        source = Product._meta.db_table
+        # A real join lets FTS5 drive the lookup and hand bm25 back per row;
+        # Django has no expression for joining a virtual table, hence extra().
+        return queryset.extra(
+            tables=[self.table],
+            where=[f'{self.table}.rowid = {source}.id', f'{self.table} MATCH %s'],
+            params=[match],
+            select={'search_rank': f'-bm25({self.table}, {weights})'},
+        )
+
+
+SEARCH_BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend(using='default'):
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        backend_class = import_string(backend_path)
+    else:
+        backend_class = SEARCH_BACKENDS.get(connections[using].vendor, BasicSearchBackend)
+    return backend_class(using)
+
+
+def search_products(queryset, query):
+    """Return `queryset` narrowed to products matching `query`, annotated with `search_rank`"""
+    return get_search_backend(queryset.db).search(queryset, query)
+
+
+def setup_search_backend(sender, using='default', **kwargs):
+    """post_migrate handler that builds the search index for the migrated database"""
+    get_search_backend(using).setup()
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cart import invalidate_cart_summaries_for
+from .catalog import invalidate, invalidate_catalogue, invalidate_products
+from .models import Offer, Product
+
+
+@receiver(post_save, sender=Product)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    invalidate_products([instance.id])
+
+
+# A removed product can sit in any cached listing or related list, so everything goes
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_after_delete(sender, instance, **kwargs):
+    invalidate_catalogue()
+
+
+# pre_delete: the cart lines go with the product, so they must be read before it's deleted
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_cart_summaries(sender, instance, **kwargs):
+    invalidate_cart_summaries_for(instance)
+
+
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_offers(sender, instance, **kwargs):
+    invalidate('offers')
@@ -1,3 +1,1367 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import hmac
+import io
+import json
+import random
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from benchmarks.load import Catalog, ClientSession, SCENARIOS, run_benchmark
+from benchmarks.seed import generate_products, seed_store
+
+from . import catalog
+from .cart import price_cart_items, price_session_cart
+from .catalog import reset_catalog_stats
+from .checkout import CheckoutError, place_order, release_expired_reservations, release_order_stock
+from .facets import FacetSet
+from .instrumentation import QUERY_BUDGETS, QueryBudgetExceeded, query_budget
+from .models import Cart, CartItem, Offer, Order, OrderItem, Product, Profile, WebhookEvent
+from .offers import ActiveOffer, OfferError, get_offer
+from .pagination import EstimatedCountPaginator, KeysetPaginator, estimate_count
+from .payments import mark_order_paid
+from .paystack import CircuitOpenError, PaystackError, PaystackGateway
+from .product_io import export_rows, import_products
+from .recommendations import build_relations, refresh_relations
+from .search import SQLiteSearchBackend, get_search_backend, search_products
+from .views.order_views import ORDERS_PER_PAGE
+from .webhooks import EVENT_HANDLERS, process_batch
+
+
+def clear_caches():
+    for backend in caches.all():
+        backend.clear()
+
+
+def make_product(**kwargs):
+    defaults = {
+        'name': 'Product',
+        'price': '10.00',
+        'stock': 10,
+        'image_url': 'https://example.com/image.png',
+        'category': 'General',
+    }
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.sneaker = make_product(name='Running Sneaker', category='Footwears', description='Light trainers')
+        self.sandal = make_product(name='Leather Sandal', category='Footwears', description='Pairs well with a sneaker sock')
+        self.laptop = make_product(name='Laptop', category='Electronics', subcategory='Computers')
+
+    def test_name_matches_rank_above_description_matches(self):
+        results = list(search_products(Product.objects.all(), 'sneaker').order_by('-search_rank'))
+        self.assertEqual(results, [self.sneaker, self.sandal])
+
+    def test_prefix_and_category_matches(self):
+        self.assertEqual(list(search_products(Product.objects.all(), 'comput')), [self.laptop])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.laptop.name = 'Gaming Notebook'
+        self.laptop.save()
+        self.assertEqual(list(search_products(Product.objects.all(), 'notebook')), [self.laptop])
+        self.assertFalse(search_products(Product.objects.all(), 'laptop').exists())
+
+        self.sneaker.delete()
+        self.assertEqual(list(search_products(Product.objects.all(), 'sneaker')), [self.sandal])
+
+    def test_search_rechecks_a_missing_fts_table(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite FTS5 backend')
+        backend = get_search_backend()
+        key = (backend.using, str(backend.connection.settings_dict['NAME']))
+        # As if a search had run before migrate created the table
+        with mock.patch.dict(SQLiteSearchBackend._available, {key: False}):
+            self.assertTrue(backend.available())
+            self.assertEqual(list(search_products(Product.objects.all(), 'comput')), [self.laptop])
+
+    def test_all_products_search_keeps_filters(self):
+        response = self.client.get(reverse('all_products'), {'q': 'sneaker', 'category': 'Footwears', 'max_price': '100'})
+        self.assertEqual(list(response.context['products']), [self.sneaker, self.sandal])
+
+        response = self.client.get(reverse('all_products'), {'q': 'sneaker', 'sort': 'name'})
+        self.assertEqual(list(response.context['products']), [self.sandal, self.sneaker])
+
+    def test_query_without_words_finds_nothing(self):
+        for query in ('!!!', '"'):
+            response = self.client.get(reverse('all_products'), {'q': query})
+            self.assertEqual(response.status_code, 200, query)
+            self.assertEqual(list(response.context['products']), [], query)
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        # Repeated prices force the id tie-breaker to do its job
+        self.products = [make_product(name=f'Item {i:02d}', price=f'{i % 4}.00') for i in range(11)]
+
+    def walk(self, queryset, per_page=3):
+        paginator = KeysetPaginator(queryset, per_page)
+        page = paginator.get_page()
+        pages = [list(page)]
+        while page.has_next():
+            page = paginator.get_page(cursor=page.next_cursor)
+            pages.append(list(page))
+        return paginator, page, pages
+
+    def test_forward_walk_matches_offset_ordering(self):
+        for ordering in (['name'], ['price'], ['-price'], ['-id']):
+            queryset = Product.objects.order_by(*ordering)
+            paginator, last_page, pages = self.walk(queryset)
+            expected = list(queryset.order_by(*paginator.ordering))
+            self.assertEqual([p for page in pages for p in page], expected, ordering)
+            self.assertEqual(last_page.number, paginator.num_pages)
+
+    def test_previous_cursor_returns_preceding_page(self):
+        paginator, page, pages = self.walk(Product.objects.order_by('-price'))
+        for expected in reversed(pages[:-1]):
+            page = paginator.get_page(cursor=page.previous_cursor)
+            self.assertEqual(list(page), expected)
+        self.assertFalse(page.has_previous())
+        self.assertEqual(page.number, 1)
+
+    def test_page_numbers_still_work(self):
+        queryset = Product.objects.order_by('price')
+        _, _, pages = self.walk(queryset)
+        paginator = KeysetPaginator(queryset, 3)
+        self.assertEqual(list(paginator.get_page(page=2)), pages[1])
+        self.assertEqual(list(paginator.get_page(page='last')), pages[-1])
+        self.assertEqual(list(paginator.get_page(page='bogus')), pages[0])
+        self.assertEqual(list(paginator.get_page(cursor='tampered', page=2)), pages[1])
+
+    def test_cursor_from_another_ordering_is_ignored(self):
+        _, _, pages = self.walk(Product.objects.order_by('price'))
+        page = KeysetPaginator(Product.objects.order_by('name'), 3).get_page()
+        for ordering in (['price'], ['-price']):
+            paginator = KeysetPaginator(Product.objects.order_by(*ordering), 3)
+            self.assertEqual(list(paginator.get_page(cursor=page.next_cursor, page=2)), list(paginator.get_page(page=2)), ordering)
+        self.assertEqual(list(KeysetPaginator(Product.objects.order_by('price'), 3).get_page(cursor=page.next_cursor)), pages[0])
+
+        response = self.client.get(reverse('all_products'), {'sort': 'price_low', 'cursor': page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+
+    def test_cursor_values_of_the_wrong_type_are_ignored(self):
+        paginator = KeysetPaginator(Product.objects.order_by('price'), 3)
+        cursor = signing.dumps(
+            {'ordering': paginator.ordering, 'values': ['Item 11', 1], 'direction': 'next', 'page': 2},
+            salt=KeysetPaginator.cursor_salt, compress=True,
+        )
+        self.assertEqual(list(paginator.get_page(cursor=cursor)), list(paginator.get_page()))
+
+    def test_cursor_page_costs_one_query_once_count_is_cached(self):
+        paginator = KeysetPaginator(Product.objects.order_by('name'), 3)
+        page = paginator.get_page()
+        self.assertEqual(paginator.count, 11)
+        cursor = page.next_cursor
+        with self.assertNumQueries(1):
+            page = KeysetPaginator(Product.objects.order_by('name'), 3).get_page(cursor=cursor)
+            self.assertEqual(page.paginator.num_pages, 4)
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('shopper', password='pass12345')
+        self.shoe = make_product(name='Shoe', price='12.50')
+        self.hat = make_product(name='Hat', price='3.00')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.shoe, quantity=2)
+        self.client.force_login(self.user)
+
+    def test_cart_count_is_read_only_and_cached(self):
+        response = self.client.get(reverse('get_cart_count'))
+        self.assertEqual(response.json(), {'count': 2, 'total': '25.00'})
+        # Warm cache: only the session's user is loaded, nothing is written
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('get_cart_count'))
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_cart_mutations_invalidate_summary(self):
+        self.client.get(reverse('get_cart_count'))
+        self.client.post(reverse('add_to_cart', args=[self.hat.id]))
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json(), {'count': 3, 'total': '28.00'})
+        self.client.post(reverse('update_cart_quantity', args=[self.shoe.id]), {'quantity': 1})
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json()['count'], 2)
+        self.client.post(reverse('remove_from_cart', args=[self.hat.id]))
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json()['count'], 1)
+
+    def test_product_changes_invalidate_summary(self):
+        self.client.get(reverse('get_cart_count'))
+        self.shoe.price = '20.00'
+        self.shoe.save()
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json(), {'count': 2, 'total': '40.00'})
+        self.shoe.delete()
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json(), {'count': 0, 'total': '0.00'})
+
+    def test_session_cart_counts_only_existing_products(self):
+        self.client.logout()
+        session = self.client.session
+        session['cart'] = {str(self.hat.id): 2, '999999': 5}
+        session.save()
+        self.assertEqual(self.client.get(reverse('get_cart_count')).json(), {'count': 2, 'total': '6.00'})
+
+    def test_badge_is_rendered_server_side(self):
+        response = self.client.get(reverse('all_products'))
+        self.assertContains(response, '<span class="cart-count">2</span>', html=True)
+
+
+class CartPricingTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='shopper')
+        # Prices whose float products and sums don't come out exact
+        self.pen = make_product(name='Pen', price='0.10')
+        self.ink = make_product(name='Ink', price='0.20')
+        self.pad = make_product(name='Pad', price='1999.99')
+        self.cart = Cart.objects.create(user=self.user)
+        for product, quantity in ((self.pen, 3), (self.ink, 1), (self.pad, 7)):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_lines_count_and_total_from_one_query(self):
+        with self.assertNumQueries(1):
+            pricing = price_cart_items(CartItem.objects.filter(cart=self.cart))
+        self.assertEqual([(line.product, line.quantity) for line in pricing.lines], [(self.pen, 3), (self.ink, 1), (self.pad, 7)])
+        self.assertEqual([line.item_total for line in pricing.lines], [Decimal('0.30'), Decimal('0.20'), Decimal('13999.93')])
+        self.assertEqual(pricing.count, 11)
+        self.assertEqual(pricing.total, Decimal('14000.43'))
+        self.assertIsInstance(pricing.total, Decimal)
+        self.assertEqual(price_cart_items(CartItem.objects.none()).total, Decimal('0.00'))
+
+    def test_cart_page_checkout_admin_and_model_agree(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('view_cart')).context['cart_total'], Decimal('14000.43'))
+        self.assertEqual(self.client.get(reverse('checkout')).context['cart_total'], Decimal('14000.43'))
+        self.assertEqual(self.cart.get_total(), Decimal('14000.43'))
+        self.assertEqual(self.cart.get_item_count(), 11)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+        self.assertContains(self.client.get(reverse('admin:products_cart_changelist')), '₦14000.43')
+        self.client.force_login(self.user)
+        self.client.post(reverse('checkout'), {'address': '1 Road', 'city': 'Lagos', 'country': 'Nigeria', 'phone': '080'})
+        self.assertEqual(Order.objects.get(user=self.user).total_amount, Decimal('14000.43'))
+
+    def test_session_cart(self):
+        pricing = price_session_cart({str(self.pen.id): 3, str(self.ink.id): '1', 'junk': 2, '999999': 1})
+        self.assertEqual(pricing.count, 4)
+        self.assertEqual(pricing.total, Decimal('0.50'))
+        session = self.client.session
+        session['cart'] = {str(self.pad.id): 2}
+        session.save()
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['cart_total'], Decimal('3999.98'))
+        self.assertEqual(response.context['cart_count'], 2)
+
+
+class OfferTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='shopper')
+        self.shoe = make_product(name='Shoe', price='100.00')
+        self.sock = make_product(name='Sock', price='3.33')
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.shoe, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.sock, quantity=3)
+        self.offer = Offer.objects.create(code='SAVE15', description='15% off everything', discount=Decimal('15.00'))
+        self.client.force_login(self.user)
+
+    def test_lookups_come_from_the_compiled_map(self):
+        self.assertEqual(get_offer('save15').id, self.offer.id)
+        with self.assertNumQueries(0):
+            for code in ('SAVE15', ' save15 ', 'Save15'):
+                self.assertEqual(get_offer(code).discount, Decimal('15.00'))
+            with self.assertRaises(OfferError):
+                get_offer('NOPE')
+
+    def test_saving_an_offer_rebuilds_the_map(self):
+        get_offer('SAVE15')
+        self.offer.is_active = False
+        self.offer.save()
+        with self.assertRaises(OfferError):
+            get_offer('SAVE15')
+        Offer.objects.create(code='NEW5', description='5% off', discount=Decimal('5.00'))
+        self.assertEqual(get_offer('new5').code, 'NEW5')
+
+    def test_offers_drop_out_at_their_expiry(self):
+        now = timezone.now()
+        Offer.objects.create(code='FLASH', description='Flash sale', discount=Decimal('50.00'), expires_at=now + timedelta(hours=1))
+        self.assertEqual(get_offer('FLASH').discount, Decimal('50.00'))
+        with mock.patch('products.offers.timezone.now', return_value=now + timedelta(hours=2)), self.assertNumQueries(0):
+            with self.assertRaises(OfferError):
+                get_offer('FLASH')
+            self.assertEqual(get_offer('SAVE15').id, self.offer.id)
+
+    def test_discount_rounds_to_the_kobo(self):
+        offer = get_offer('SAVE15')
+        self.assertEqual(offer.discount_on(Decimal('209.99')), Decimal('31.50'))
+        self.assertEqual(ActiveOffer(0, 'ALL', '', Decimal('150.00')).discount_on(Decimal('10.00')), Decimal('10.00'))
+
+    def test_cart_and_checkout_apply_the_offer(self):
+        response = self.client.post(reverse('apply_promo_code'), {'code': 'nope'}, follow=True)
+        self.assertContains(response, "is not a valid promo code")
+        self.client.post(reverse('apply_promo_code'), {'code': 'save15'})
+        response = self.client.get(reverse('view_cart'))
+        # 2 x 100.00 + 3 x 3.33 = 209.99, less 15%
+        self.assertEqual(response.context['discount'], Decimal('31.50'))
+        self.assertEqual(response.context['cart_payable'], Decimal('178.49'))
+        self.assertEqual(self.client.get(reverse('checkout')).context['cart_payable'], Decimal('178.49'))
+
+        self.client.post(reverse('checkout'), {'address': '1 Road', 'city': 'Lagos', 'country': 'Nigeria', 'phone': '080'})
+        order = Order.objects.get(user=self.user)
+        self.assertEqual((order.offer, order.offer_code), (self.offer, 'SAVE15'))
+        self.assertEqual(order.discount_amount, Decimal('31.50'))
+        self.assertEqual(order.total_amount, Decimal('178.49'))
+        self.assertNotIn('offer_code', self.client.session)
+
+    def test_code_is_dropped_once_the_offer_ends(self):
+        self.client.post(reverse('apply_promo_code'), {'code': 'SAVE15'})
+        self.offer.delete()
+        response = self.client.get(reverse('view_cart'))
+        self.assertIsNone(response.context['offer'])
+        self.assertEqual(response.context['cart_payable'], Decimal('209.99'))
+        self.assertNotIn('offer_code', self.client.session)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='buyer')
+        self.products = [make_product(name=f'Item {i}', price='2.50') for i in range(5)]
+        self.client.force_login(self.user)
+
+    def place(self, user, lines, created_at=None):
+        order = Order.objects.create(
+            user=user, reference=f'ref-{Order.objects.count()}', total_amount=Decimal('0.00'),
+            shipping_address='1 Road', shipping_city='Lagos', shipping_country='Nigeria', phone='080',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price) for product, quantity in lines
+        ])
+        if created_at:
+            Order.objects.filter(id=order.id).update(created_at=created_at)
+        return order
+
+    def history_queries(self, path=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path or reverse('order_history'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_dont_grow_with_orders_or_items(self):
+        self.place(self.user, [(self.products[0], 1)])
+        # Warm the cart badge so only the history's own queries differ
+        self.history_queries()
+        _, light = self.history_queries()
+        for _ in range(24):
+            self.place(self.user, [(product, 2) for product in self.products])
+        response, heavy = self.history_queries()
+        self.assertEqual(heavy, light)
+        self.assertEqual(len(response.context['orders']), ORDERS_PER_PAGE)
+
+        order = Order.objects.filter(user=self.user).order_by('-id').first()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('order_detail', args=[order.id]))
+        self.assertLessEqual(len(queries), 4)
+        self.assertContains(response, 'Item 4')
+        self.assertEqual(response.context['order'].user, self.user)
+
+    def test_summaries_are_annotated(self):
+        self.place(self.user, [(self.products[0], 3), (self.products[1], 1)])
+        order = self.client.get(reverse('order_history')).context['orders'][0]
+        self.assertEqual(order.item_count, 4)
+        self.assertEqual(order.items_total, Decimal('10.00'))
+
+    def test_keyset_pages_cover_every_order_once(self):
+        # Several orders share a timestamp, and others differ only in microseconds
+        moment = timezone.now().replace(microsecond=123456)
+        stamps = [moment] * 4 + [moment + timedelta(microseconds=i) for i in range(1, 10)] + [moment - timedelta(days=i) for i in range(1, 11)]
+        for stamp in stamps:
+            self.place(self.user, [(self.products[0], 1)], created_at=stamp)
+        self.place(User.objects.create(username='other'), [(self.products[0], 1)])
+
+        seen = []
+        page = self.client.get(reverse('order_history')).context['orders']
+        while True:
+            seen.extend(page)
+            if not page.has_next():
+                break
+            page = self.client.get(reverse('order_history'), {'cursor': page.next_cursor}).context['orders']
+        self.assertEqual(len(seen), len(stamps))
+        self.assertEqual(len({order.id for order in seen}), len(stamps))
+        self.assertEqual(seen, sorted(seen, key=lambda order: (order.created_at, order.id), reverse=True))
+
+    def test_other_users_orders_are_hidden(self):
+        order = self.place(User.objects.create(username='other'), [(self.products[0], 1)])
+        self.assertEqual(self.client.get(reverse('order_detail', args=[order.id])).status_code, 404)
+
+
+class SessionCartMergeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('merger', password='pass12345')
+        self.products = [make_product(name=f'Item {i}') for i in range(6)]
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=2)
+
+    def login_with_session_cart(self, session_cart):
+        session = self.client.session
+        session['cart'] = session_cart
+        session.save()
+        return self.client.post(reverse('login'), {'username': 'merger', 'password': 'pass12345'})
+
+    def test_login_merges_session_cart(self):
+        session_cart = {str(p.id): 1 for p in self.products}
+        session_cart['999999'] = 4
+        self.login_with_session_cart(session_cart)
+
+        quantities = dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {p.id: 3 if p == self.products[0] else 1 for p in self.products})
+        self.assertEqual(self.client.session['cart'], {})
+
+    def test_merge_query_count_does_not_grow_with_cart_size(self):
+        counts = []
+        for size in (1, len(self.products)):
+            CartItem.objects.filter(cart__user=self.user).exclude(product=self.products[0]).delete()
+            self.client.logout()
+            with CaptureQueriesContext(connection) as queries:
+                self.login_with_session_cart({str(p.id): 1 for p in self.products[:size]})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user('buyer', password='pass12345')
+        self.products = [make_product(name=f'Item {i}', price='2.50', stock=5) for i in range(4)]
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        self.client.force_login(self.user)
+
+    def checkout(self):
+        return self.client.post(reverse('checkout'), {
+            'address': '1 Main St', 'city': 'Lagos', 'country': 'Nigeria', 'phone': '0800',
+        })
+
+    def test_checkout_reserves_stock_and_writes_order(self):
+        response = self.checkout()
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('payment', args=[order.id]), fetch_redirect_response=False)
+        self.assertEqual(order.total_amount, Decimal('20.00'))
+        self.assertEqual(order.items.count(), 4)
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        for product in Product.objects.all():
+            self.assertEqual((product.stock, product.reserved_stock, product.available_stock), (5, 2, 3))
+
+    def test_checkout_rejects_reserved_stock(self):
+        Product.objects.filter(id=self.products[0].id).update(reserved_stock=4)
+        with self.assertRaises(CheckoutError):
+            place_order(self.user, {})
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 4)
+        self.assertEqual(list(Product.objects.values_list('reserved_stock', flat=True)), [4, 0, 0, 0])
+
+    def test_cancelling_releases_reservation(self):
+        self.checkout()
+        order = Order.objects.get(user=self.user)
+        self.assertTrue(release_order_stock(order))
+        self.assertFalse(release_order_stock(order))
+        self.assertEqual(set(Product.objects.values_list('reserved_stock', flat=True)), {0})
+
+    def test_expired_reservations_are_released(self):
+        self.checkout()
+        order = Order.objects.get(user=self.user)
+        recent_buyer = User.objects.create_user('recent')
+        CartItem.objects.create(cart=Cart.objects.create(user=recent_buyer), product=self.products[0], quantity=1)
+        recent = place_order(recent_buyer, {})
+        self.assertEqual(release_expired_reservations(), 0)
+
+        Order.objects.filter(id=order.id).update(created_at=timezone.now() - timedelta(hours=1))
+        out = io.StringIO()
+        call_command('release_expired_reservations', '--minutes', '30', stdout=out)
+        self.assertIn('Released 1', out.getvalue())
+        order.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual((order.status, recent.status), ('cancelled', 'pending'))
+        self.assertEqual(list(Product.objects.order_by('id').values_list('reserved_stock', flat=True)), [1, 0, 0, 0])
+        self.assertEqual(release_expired_reservations(), 0)
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    shoppers = 8
+    stock = 3
+
+    def test_parallel_checkouts_never_oversell(self):
+        product = make_product(name='Limited Edition', stock=self.stock)
+        users = []
+        for i in range(self.shoppers):
+            user = User.objects.create_user(f'racer{i}')
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=1)
+            users.append(user)
+
+        barrier = threading.Barrier(self.shoppers)
+        outcomes = []
+
+        def attempt(user):
+            try:
+                barrier.wait()
+                place_order(user, {})
+                outcomes.append('placed')
+            except (CheckoutError, DatabaseError):
+                outcomes.append('rejected')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        product.refresh_from_db()
+        placed = outcomes.count('placed')
+        self.assertEqual(len(outcomes), self.shoppers)
+        self.assertLessEqual(placed, self.stock)
+        self.assertEqual(product.reserved_stock, placed)
+        self.assertEqual(Order.objects.count(), placed)
+        if connection.features.has_select_for_update:
+            self.assertEqual(placed, self.stock)
+
+
+class PaidOrderMixin:
+    def setUp(self):
+        self.user = User.objects.create_user('payer', password='pass12345')
+        self.products = [make_product(name=f'Item {i}', stock=5) for i in range(3)]
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products:
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        self.order = place_order(self.user, {})
+
+    def send_webhook(self, reference):
+        body = json.dumps({'event': 'charge.success', 'data': {'reference': reference, 'status': 'success'}}).encode()
+        signature = hmac.new(b'sk_test_secret', body, hashlib.sha512).hexdigest()
+        return self.client.post(
+            reverse('paystack_webhook'), body, content_type='application/json',
+            HTTP_X_PAYSTACK_SIGNATURE=signature,
+        )
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test_secret')
+class PaymentFulfilmentTests(PaidOrderMixin, TestCase):
+    def test_webhook_converts_reservation_into_sale(self):
+        self.assertEqual(self.send_webhook(self.order.reference).status_code, 200)
+        call_command('process_webhooks', once=True, stdout=io.StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(set(Product.objects.values_list('stock', 'reserved_stock')), {(3, 0)})
+
+    def test_duplicate_confirmation_is_a_single_no_op_query(self):
+        self.assertTrue(mark_order_paid(self.order.reference))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(mark_order_paid(self.order.reference))
+        statements = [q['sql'] for q in queries if 'SAVEPOINT' not in q['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {3})
+
+    def test_verify_payment_only_accepts_the_orders_own_reference(self):
+        self.client.force_login(self.user)
+        gateway = mock.Mock()
+        gateway.verify_transaction.return_value = {'status': True, 'data': {'status': 'success'}}
+        with mock.patch('products.views.order_views.get_gateway', return_value=gateway):
+            url = reverse('verify_payment', args=[self.order.id])
+            response = self.client.post(url, {'reference': 'PS-SOMEOTHERORDER'})
+            self.assertFalse(response.json()['success'])
+            gateway.verify_transaction.assert_not_called()
+            self.order.refresh_from_db()
+            self.assertEqual(self.order.status, 'pending')
+
+            self.assertTrue(self.client.post(url, {'reference': self.order.reference}).json()['success'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    def test_payment_after_expiry_is_fulfilled_while_stock_lasts(self):
+        release_order_stock(self.order)
+        self.assertEqual(self.send_webhook(self.order.reference).status_code, 200)
+        call_command('process_webhooks', once=True, release_interval=0, stdout=io.StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(set(Product.objects.values_list('stock', 'reserved_stock')), {(3, 0)})
+
+    def test_payment_after_expiry_without_stock_is_flagged_for_refund(self):
+        release_order_stock(self.order)
+        Product.objects.filter(id=self.products[0].id).update(reserved_stock=4)
+        self.client.force_login(self.user)
+        gateway = mock.Mock()
+        gateway.verify_transaction.return_value = {'status': True, 'data': {'status': 'success'}}
+        with mock.patch('products.views.order_views.get_gateway', return_value=gateway), \
+                self.assertLogs('products.payments', 'ERROR'):
+            response = self.client.post(reverse('verify_payment', args=[self.order.id]), {'reference': self.order.reference})
+        self.assertFalse(response.json()['success'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'refund_due')
+        self.assertEqual(list(Product.objects.order_by('id').values_list('stock', 'reserved_stock')), [(5, 4), (5, 0), (5, 0)])
+
+    def test_payment_page_refuses_an_expiring_reservation(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('payment', args=[self.order.id])).status_code, 200)
+        Order.objects.filter(id=self.order.id).update(created_at=timezone.now() - timedelta(minutes=25))
+        response = self.client.get(reverse('payment', args=[self.order.id]))
+        self.assertRedirects(response, reverse('order_detail', args=[self.order.id]), fetch_redirect_response=False)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+        self.assertEqual(set(Product.objects.values_list('reserved_stock', flat=True)), {0})
+
+    def test_fulfilment_query_count_is_independent_of_order_size(self):
+        with CaptureQueriesContext(connection) as queries:
+            mark_order_paid(self.order.reference)
+        self.assertEqual(len([q for q in queries if 'SAVEPOINT' not in q['sql']]), 3)
+
+
+@override_settings(PAYSTACK_SECRET_KEY='sk_test_secret')
+class WebhookQueueTests(PaidOrderMixin, TestCase):
+    def test_webhook_only_queues_and_deduplicates(self):
+        for _ in range(3):
+            self.assertEqual(self.send_webhook(self.order.reference).status_code, 200)
+        self.assertEqual(WebhookEvent.objects.get().status, 'pending')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_bad_signature_is_rejected(self):
+        response = self.client.post(
+            reverse('paystack_webhook'), b'{}', content_type='application/json', HTTP_X_PAYSTACK_SIGNATURE='nope',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_failed_events_are_retried_with_backoff(self):
+        self.send_webhook(self.order.reference)
+
+        def explode(payload):
+            raise RuntimeError('database hiccup')
+
+        with mock.patch.dict(EVENT_HANDLERS, {'charge.success': explode}), self.assertLogs('products.webhooks', 'ERROR'):
+            self.assertEqual(process_batch(), 1)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.last_error), ('pending', 1, 'database hiccup'))
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(process_batch(), 0)
+
+        WebhookEvent.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(process_batch(), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ('done', 2))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+
+class StubPaystackHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.client_address, self.path, self.headers.get('Authorization')))
+        status = server.statuses.pop(0) if server.statuses else 200
+        reference = self.path.rsplit('/', 1)[-1]
+        body = json.dumps({'status': True, 'data': {'reference': reference, 'status': 'success'}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PaystackGatewayTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPaystackHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.gateway = PaystackGateway(
+            'sk_test_stub', base_url=f'http://127.0.0.1:{self.server.server_port}',
+            timeout=2, max_retries=2, breaker_threshold=2, backoff=0,
+        )
+
+    def tearDown(self):
+        self.gateway.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_verifications_reuse_one_keep_alive_connection(self):
+        for reference in ('PS-1', 'PS-2', 'PS-3'):
+            self.assertEqual(self.gateway.verify_transaction(reference)['data']['reference'], reference)
+        clients = {address for address, _, _ in self.server.requests}
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(self.server.requests[0][1:], ('/transaction/verify/PS-1', 'Bearer sk_test_stub'))
+
+    def test_successful_verification_is_cached(self):
+        self.gateway.verify_transaction('PS-1')
+        self.gateway.verify_transaction('PS-1')
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_server_errors_are_retried(self):
+        self.server.statuses = [503, 502]
+        self.assertTrue(self.gateway.verify_transaction('PS-1')['status'])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.statuses = [500] * 6
+        for _ in range(2):
+            with self.assertRaises(PaystackError):
+                self.gateway.verify_transaction('PS-1')
+        with self.assertRaises(CircuitOpenError):
+            self.gateway.verify_transaction('PS-1')
+        self.assertEqual(len(self.server.requests), 6)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        reset_catalog_stats()
+        self.shoe = make_product(name='Shoe', category='Footwears')
+        self.boot = make_product(name='Boot', category='Footwears')
+
+    def test_reads_are_served_from_cache(self):
+        self.assertEqual(catalog.get_product(self.shoe.id), self.shoe)
+        self.assertEqual(catalog.get_related_products(self.shoe), [self.boot])
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get_product(self.shoe.id), self.shoe)
+            self.assertEqual(catalog.get_related_products(self.shoe), [self.boot])
+        self.assertEqual(catalog.catalog_stats(), {'hits': 2, 'misses': 2, 'stale': 0})
+
+    def test_product_changes_invalidate_cached_entries(self):
+        self.assertEqual(catalog.get_categories(), ['Footwears'])
+        catalog.get_product(self.shoe.id)
+        catalog.get_related_products(self.boot)
+
+        self.shoe.price = '99.00'
+        self.shoe.save()
+        make_product(name='Laptop', category='Electronics')
+        self.assertEqual(catalog.get_product(self.shoe.id).price, Decimal('99.00'))
+        self.assertEqual(catalog.get_categories(), ['Electronics', 'Footwears'])
+
+        self.shoe.delete()
+        self.assertEqual(catalog.get_related_products(self.boot), [])
+
+    def test_stock_changes_keep_the_rest_of_the_catalogue_cached(self):
+        featured = catalog.get_featured_products(['Footwears'])
+        self.assertEqual(catalog.get_categories(), ['Footwears'])
+        catalog.get_product(self.boot.id)
+        user = User.objects.create_user('stock-buyer')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.shoe, quantity=1)
+        place_order(user, {})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get_categories(), ['Footwears'])
+            self.assertEqual(catalog.get_featured_products(['Footwears']), featured)
+            self.assertEqual(catalog.get_product(self.boot.id), self.boot)
+        self.assertEqual(catalog.get_product(self.shoe.id).reserved_stock, 1)
+
+    def test_expired_entry_is_served_stale_while_another_request_rebuilds(self):
+        catalog.cached('facets', 'answer', lambda: 1, timeout=-1)
+        key = catalog.catalog_key('facets', 'answer')
+        catalog.cache.add(f'{key}:lock', 1)
+        self.assertEqual(catalog.cached('facets', 'answer', lambda: 2), 1)
+        catalog.cache.delete(f'{key}:lock')
+        self.assertEqual(catalog.cached('facets', 'answer', lambda: 2), 2)
+        self.assertEqual(catalog.catalog_stats()['stale'], 1)
+
+    def test_cold_miss_that_stops_waiting_leaves_the_lock_alone(self):
+        key = catalog.catalog_key('facets', 'answer')
+        catalog.cache.add(f'{key}:lock', 'holder')
+        with mock.patch.object(catalog.time, 'sleep'):
+            self.assertEqual(catalog.cached('facets', 'answer', lambda: 2), 2)
+        self.assertEqual(catalog.cache.get(f'{key}:lock'), 'holder')
+
+    def test_product_detail_404s_for_unknown_product(self):
+        self.assertEqual(self.client.get(reverse('product_detail', args=[999999])).status_code, 404)
+
+
+class LandingPageTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        make_product(name='Zebra Sneaker', category='Footwears')
+        self.sneaker = make_product(name='Air Sneaker', category='footwears')
+        make_product(name='Aaa No Image', category='Footwears', image_url='')
+        self.laptop = make_product(name='Laptop', category='Electronics')
+        make_product(name='Spanner', category='Tools')
+
+    def test_featured_products_come_from_one_query_then_cache(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('landing'))
+        self.assertEqual(response.context['featured_products'], [self.sneaker, self.laptop])
+        with self.assertNumQueries(0):
+            self.client.get(reverse('landing'))
+
+    def test_featured_products_refresh_on_product_change(self):
+        self.client.get(reverse('landing'))
+        apple = make_product(name='Apple', category='Groceries')
+        self.assertEqual(self.client.get(reverse('landing')).context['featured_products'], [self.sneaker, apple, self.laptop])
+
+
+class CategoryKeyTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.sneaker = make_product(name='Sneaker', category=' Footwears', subcategory='Running')
+        self.boot = make_product(name='Boot', category='footwears')
+        make_product(name='Laptop', category='Electronics', subcategory='Laptops')
+
+    def test_keys_follow_category_changes(self):
+        self.assertEqual((self.sneaker.category_key, self.sneaker.subcategory_key), ('footwears', 'running'))
+        self.boot.category = 'ELECTRONICS'
+        self.boot.save(update_fields=['category'])
+        self.boot.refresh_from_db()
+        self.assertEqual(self.boot.category_key, 'electronics')
+
+    def test_category_filters_match_any_case(self):
+        response = self.client.get(reverse('all_products'), {'category': 'FOOTWEARS'})
+        self.assertEqual({product.name for product in response.context['products']}, {'Sneaker', 'Boot'})
+        response = self.client.get(reverse('electronics'), {'subcategory': 'laptops'})
+        self.assertEqual([product.name for product in response.context['products']], ['Laptop'])
+        self.assertEqual(response.context['subcategories'], ['Laptops'])
+
+    def test_category_lookups_use_key_indexes(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would otherwise always be scanned sequentially
+                cursor.execute('SET enable_seqscan = off')
+            for queryset in (
+                Product.objects.filter(category_key='footwears'),
+                Product.objects.filter(category_key='footwears', subcategory_key='running'),
+                Product.objects.filter(category_key='footwears').order_by('name'),
+            ):
+                self.assertRegex(queryset.explain(), r'product_category_(key|name)_idx')
+
+
+class OrderIndexTests(TestCase):
+    """Each index on the order and cart tables is here because one of these plans needs it"""
+
+    def setUp(self):
+        self.user = User.objects.create(username='shopper')
+        self.cart = Cart.objects.create(user=self.user)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Tiny test tables would otherwise always be scanned sequentially
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertPlan(self, queryset, index):
+        plan = queryset.explain()
+        self.assertRegex(plan, index)
+        # The index must also deliver the ordering, without a separate sort step
+        self.assertNotRegex(plan, r'TEMP B-TREE|\bSort\b')
+
+    def test_history_is_read_in_keyset_order_from_one_index(self):
+        self.assertPlan(Order.objects.filter(user=self.user).order_by('-created_at', '-id')[:11], r'order_user_created_idx')
+        cursor = timezone.now()
+        self.assertPlan(
+            Order.objects.filter(user=self.user).filter(Q(created_at__lt=cursor) | Q(created_at=cursor, id__lt=10))
+            .order_by('-created_at', '-id')[:11],
+            r'order_user_created_idx',
+        )
+
+    def test_status_lists_use_the_status_index(self):
+        self.assertPlan(Order.objects.filter(status='pending').order_by('-created_at'), r'order_status_created_idx')
+        self.assertPlan(Order.objects.filter(status='paid', created_at__gte=timezone.now() - timedelta(days=7)), r'order_status_created_idx')
+
+    def test_webhook_reference_lookup_uses_the_unique_index(self):
+        self.assertPlan(
+            Order.objects.filter(reference='PS-123', status='pending'),
+            r'products_order_reference_\w+|sqlite_autoindex_products_order_\d+ \(reference=',
+        )
+
+    def test_cart_line_lookup_uses_the_unique_constraint(self):
+        self.assertPlan(
+            CartItem.objects.filter(cart=self.cart, product_id=1),
+            r'products_cartitem_cart_id_product_id_\w+_uniq',
+        )
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        make_product(name='Trail Sneaker', category='Footwears', subcategory='Running', price=Decimal('8000'))
+        make_product(name='Court Sneaker', category='footwears', price=Decimal('25000'))
+        make_product(name='Sneaker Cleaner', category='Groceries', price=Decimal('1500'))
+        make_product(name='Gaming Laptop', category='Electronics', subcategory='Laptops', price=Decimal('450000'))
+        make_product(name='Office Laptop', category='Electronics', subcategory='laptops', price=Decimal('200000'))
+        make_product(name='Phone', category='Electronics', subcategory='Phones', price=Decimal('120000'))
+
+    def counts(self, facets, name):
+        return {facet['label']: facet['count'] for facet in facets[name]}
+
+    def test_counts_group_categories_case_insensitively(self):
+        facets = FacetSet().counts()
+        self.assertEqual(self.counts(facets, 'categories'), {'Electronics': 3, 'Footwears': 2, 'Groceries': 1})
+        self.assertEqual(self.counts(facets, 'subcategories'), {'Laptops': 2, 'Phones': 1, 'Running': 1})
+        self.assertEqual([bucket['count'] for bucket in facets['prices']], [2, 1, 1, 2])
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = FacetSet(category='electronics', max_price=Decimal('199999.99')).counts()
+        # Other categories stay visible under the price cap; prices still show every Electronics bucket
+        self.assertEqual(self.counts(facets, 'categories'), {'Electronics': 1, 'Footwears': 2, 'Groceries': 1})
+        self.assertEqual(self.counts(facets, 'subcategories'), {'Phones': 1})
+        self.assertEqual([bucket['count'] for bucket in facets['prices']], [0, 0, 1, 2])
+
+    def test_counts_follow_search_query(self):
+        facets = FacetSet(query='sneaker').counts()
+        self.assertEqual(self.counts(facets, 'categories'), {'Footwears': 2, 'Groceries': 1})
+
+    def test_counts_are_cached_per_signature_until_products_change(self):
+        with self.assertNumQueries(3):
+            FacetSet(category='Footwears').counts()
+        with self.assertNumQueries(0):
+            FacetSet(category=' FOOTWEARS').counts()
+        with self.assertNumQueries(3):
+            FacetSet(category='Groceries').counts()
+
+        make_product(name='Sandal', category='Footwears', price=Decimal('3000'))
+        self.assertEqual(self.counts(FacetSet().counts(), 'categories')['Footwears'], 3)
+
+    def test_listing_renders_facet_counts(self):
+        response = self.client.get(reverse('all_products'), {'category': 'Footwears'})
+        self.assertContains(response, 'Electronics (3)')
+        self.assertContains(response, 'Under ₦10,000')
+        response = self.client.get(reverse('electronics'))
+        self.assertContains(response, 'Laptops (2)')
+
+
+class ProductImportExportTests(TestCase):
+    CSV = (
+        "sku,name,price,stock,category,subcategory,image_url,description\n"
+        "SKU-1,Trail Sneaker,8000.00,5,Footwears,Running,https://example.com/1.png,Grippy\n"
+        "SKU-2,Office Laptop,200000,3,ELECTRONICS,Laptops,https://example.com/2.png,\n"
+        "SKU-3,Broken,not-a-price,1,Tools,,https://example.com/3.png,\n"
+        ",No Sku,10,1,Tools,,https://example.com/4.png,\n"
+    )
+
+    def setUp(self):
+        clear_caches()
+        self.existing = make_product(sku='SKU-1', name='Old Sneaker', price='5000', reserved_stock=2)
+
+    def test_import_upserts_by_sku_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = import_products(io.StringIO(self.CSV), 'csv', batch_size=2)
+        self.assertEqual((result.rows, result.created, result.updated, result.invalid), (4, 1, 1, 2))
+        self.assertEqual([line for line, message in result.errors], [4, 5])
+        self.assertIn('price', result.errors[0][1])
+        # One SKU lookup and one upsert per batch with valid rows (plus savepoints)
+        self.assertLessEqual(len([q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]), 4)
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Trail Sneaker', Decimal('8000.00'), 5))
+        self.assertEqual(self.existing.reserved_stock, 2)
+        laptop = Product.objects.get(sku='SKU-2')
+        self.assertEqual((laptop.category_key, laptop.subcategory_key), ('electronics', 'laptops'))
+        self.assertIsNotNone(laptop.updated_at)
+
+    def test_import_refreshes_cached_products(self):
+        self.assertEqual(catalog.get_product(self.existing.id).name, 'Old Sneaker')
+        import_products(io.StringIO(self.CSV))
+        self.assertEqual(catalog.get_product(self.existing.id).name, 'Trail Sneaker')
+
+    def test_dry_run_writes_nothing(self):
+        result = import_products(io.StringIO(self.CSV), dry_run=True)
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Product.objects.get().name, 'Old Sneaker')
+
+    def test_export_round_trips_through_import(self):
+        make_product(sku='SKU-9', name='Spanner', category='Tools', subcategory=None, description=None)
+        for fmt in ('csv', 'jsonl'):
+            exported = ''.join(export_rows(fmt=fmt))
+            Product.objects.update(name='Changed')
+            result = import_products(io.StringIO(exported), fmt)
+            self.assertEqual((result.updated, result.invalid), (2, 0))
+            self.assertEqual(sorted(Product.objects.values_list('name', flat=True)), ['Old Sneaker', 'Spanner'])
+
+    def test_management_commands(self):
+        out = io.StringIO()
+        call_command('export_products', '--format', 'jsonl', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['sku'], 'SKU-1')
+
+        with mock.patch('sys.stdin', io.StringIO(self.CSV)):
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_products', '-', '--dry-run', stdout=out, stderr=err)
+        self.assertIn('would have created 1, updated 1, skipped 2 of 4', out.getvalue())
+        self.assertIn('Line 4: price', err.getvalue())
+
+    def test_admin_export_streams_selected_products(self):
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(admin_user)
+        response = self.client.post(reverse('admin:products_product_changelist'), {
+            'action': 'export_csv', '_selected_action': [self.existing.id],
+        })
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'sku,name,price,stock,category,subcategory,image_url,description')
+        self.assertTrue(lines[1].startswith('SKU-1,Old Sneaker,5000.00,'))
+
+
+class AdminChangelistQueryTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+        self.products = [make_product(name=f'Product {i}', price=Decimal('10.00') * (i + 1)) for i in range(3)]
+
+    def add_rows(self, start, count):
+        for i in range(start, start + count):
+            user = User.objects.create(username=f'shopper{i}')
+            cart = Cart.objects.create(user=user)
+            for product in self.products:
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+            order = Order.objects.create(
+                user=user, reference=f'ref-{i}', total_amount=Decimal('60.00'),
+                shipping_address='1 Road', shipping_city='Lagos', shipping_country='Nigeria', phone='080',
+            )
+            for product in self.products:
+                order.items.create(product=product, quantity=1, price=product.price)
+            Profile.objects.create(user=user, city='Lagos')
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:products_{model}_changelist')
+        self.client.get(url)  # warm the session and content types
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assert_constant_queries(self, model):
+        self.add_rows(0, 2)
+        few, _ = self.changelist_queries(model)
+        self.add_rows(2, 8)
+        many, response = self.changelist_queries(model)
+        self.assertEqual(few, many, f'{model} changelist queries grow with rows')
+        return response
+
+    def test_cart_changelist_annotates_counts_and_totals(self):
+        response = self.assert_constant_queries('cart')
+        self.assertContains(response, '₦120.00', count=10)
+        cart = Cart.objects.first()
+        self.assertEqual(cart.get_item_count(), 6)
+        self.assertEqual(cart.get_total(), Decimal('120.00'))
+
+    def test_order_changelist_selects_users(self):
+        response = self.assert_constant_queries('order')
+        self.assertContains(response, 'shopper9')
+
+    def test_profile_changelist_selects_users(self):
+        self.assert_constant_queries('profile')
+
+    def test_product_changelist(self):
+        self.assert_constant_queries('product')
+
+    def test_order_change_page_selects_item_products(self):
+        self.add_rows(0, 1)
+        order = Order.objects.get()
+        url = reverse('admin:products_order_change', args=[order.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        for product in self.products:
+            order.items.create(product=product, quantity=1, price=product.price)
+        with self.assertNumQueries(len(queries)):
+            self.client.get(url)
+
+    def test_changelist_actions_still_work_on_annotated_querysets(self):
+        self.add_rows(0, 2)
+        response = self.client.post(reverse('admin:products_cart_changelist'), {
+            'action': 'delete_selected', '_selected_action': list(Cart.objects.values_list('id', flat=True)), 'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_estimated_count_only_for_unfiltered_lists(self):
+        self.assertIsNone(estimate_count(Product.objects.filter(price__gt=0)))
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.assertEqual(estimate_count(Product.objects.all()), 3)
+        paginator = EstimatedCountPaginator(Product.objects.all(), 10)
+        paginator.exact_below = 0
+        with mock.patch('products.pagination.estimate_count', return_value=50000):
+            self.assertEqual(paginator.count, 50000)
+        self.assertEqual(EstimatedCountPaginator(Product.objects.all(), 10).count, 3)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.product = make_product(name='Sneaker', price='100.00', category='Footwears')
+
+    def test_product_cards_follow_price_changes(self):
+        self.assertContains(self.client.get(reverse('all_products')), '₦100.00')
+        self.product.price = Decimal('120.00')
+        self.product.save()
+        response = self.client.get(reverse('all_products'))
+        self.assertContains(response, '₦120.00')
+        self.assertNotContains(response, '₦100.00')
+
+    def test_per_user_markup_stays_outside_cached_fragments(self):
+        self.client.get(reverse('all_products'))
+        self.client.force_login(User.objects.create(username='shopper'))
+        response = self.client.get(reverse('all_products'))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, reverse('logout'))
+        self.assertNotContains(response, 'Login to Buy')
+
+
+class ProductDetailConditionalGetTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.product = make_product(name='Sneaker', price='100.00', category='Footwears', stock=5)
+        self.related = make_product(name='Boot', price='80.00', category='Footwears')
+        self.url = reverse('product_detail', args=[self.product.id])
+
+    def test_repeat_anonymous_views_get_304_without_queries(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_price_and_stock_changes_produce_a_new_page(self):
+        etag = self.client.get(self.url)['ETag']
+        self.product.price = Decimal('120.00')
+        self.product.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '₦120')
+        etag = response['ETag']
+
+        user = User.objects.create(username='shopper')
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.product, quantity=5)
+        place_order(user, {'shipping_address': '1 Road', 'shipping_city': 'Lagos', 'shipping_country': 'Nigeria', 'phone': '080'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Out of stock')
+
+    def test_related_product_changes_produce_a_new_page(self):
+        etag = self.client.get(self.url)['ETag']
+        self.related.name = 'Rain Boot'
+        self.related.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Rain Boot')
+
+    def test_signed_in_users_get_their_own_page(self):
+        self.client.get(self.url)
+        self.client.force_login(User.objects.create(username='shopper'))
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'shopper')
+
+
+class RecentlyViewedTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='shopper')
+        self.products = [make_product(name=f'Product {i}', category=f'Category {i}') for i in range(4)]
+
+    def view(self, product):
+        return self.client.get(reverse('product_detail', args=[product.id]))
+
+    def test_views_are_tracked_in_a_signed_cookie_without_db_writes(self):
+        self.client.force_login(self.user)
+        self.view(self.products[0])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.view(self.products[1])
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))])
+        self.assertIn('recently_viewed', response.cookies)
+        self.assertNotIn('recently_viewed', self.client.session)
+
+        # Re-viewing the newest product doesn't re-send the cookie
+        self.assertNotIn('recently_viewed', self.view(self.products[1]).cookies)
+
+    def test_profile_lists_products_in_viewing_order(self):
+        self.client.force_login(self.user)
+        for index in (2, 0, 3, 0):
+            self.view(self.products[index])
+        self.products[3].delete()
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.context['recent_products'], [self.products[0], self.products[2]])
+
+    def test_tampered_cookie_is_ignored_and_clear_removes_it(self):
+        self.client.force_login(self.user)
+        self.client.cookies['recently_viewed'] = f'{self.products[1].id}:forged'
+        self.assertEqual(self.client.get(reverse('profile')).context['recent_products'], [])
+
+        self.view(self.products[1])
+        response = self.client.post(reverse('clear_recently_viewed'))
+        self.assertEqual(response.cookies['recently_viewed'].value, '')
+        self.assertEqual(self.client.get(reverse('profile')).context['recent_products'], [])
+
+    def test_anonymous_304s_still_record_the_view(self):
+        etag = self.view(self.products[0])['ETag']
+        self.view(self.products[1])
+        response = self.client.get(reverse('product_detail', args=[self.products[0].id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('recently_viewed', response.cookies)
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='shopper')
+        self.sneaker = make_product(name='Sneaker', category='Footwears', subcategory='Running')
+        self.boot = make_product(name='Boot', category='Footwears')
+        self.sandal = make_product(name='Sandal', category='Footwears', subcategory='Running')
+        self.socks = make_product(name='Socks', category='Groceries')
+        self.phone = make_product(name='Phone', category='Electronics')
+        self.order([self.sneaker, self.socks])
+        self.order([self.sneaker, self.socks])
+        self.order([self.sneaker, self.boot])
+        self.order([self.sneaker, self.phone], status='pending')
+
+    def order(self, products, status='paid'):
+        order = Order.objects.create(
+            user=self.user, reference=f'ref-{Order.objects.count()}', total_amount=Decimal('10.00'), status=status,
+            shipping_address='1 Road', shipping_city='Lagos', shipping_country='Nigeria', phone='080',
+        )
+        for product in products:
+            order.items.create(product=product, quantity=1, price=product.price)
+        return order
+
+    def test_co_purchases_outrank_category_matches(self):
+        self.assertEqual(build_relations(), 5)
+        with self.assertNumQueries(1):
+            related = catalog.get_related_products(self.sneaker)
+        # Bought together twice, then together once plus same category, then same subcategory only
+        self.assertEqual(related, [self.socks, self.boot, self.sandal])
+        self.assertEqual(catalog.get_related_products(self.phone), [])
+
+    def test_falls_back_to_category_until_the_index_is_built(self):
+        self.assertEqual(set(catalog.get_related_products(self.boot)), {self.sneaker, self.sandal})
+
+    def test_incremental_refresh_only_touches_changed_products(self):
+        build_relations()
+        self.order([self.sandal, self.phone])
+        refreshed = refresh_relations()
+        # The new order's products, plus the phone which had no relations before
+        self.assertEqual(refreshed, 2)
+        self.assertEqual(catalog.get_related_products(self.phone), [self.sandal])
+        self.assertEqual(catalog.get_related_products(self.sandal)[0], self.phone)
+
+    def test_management_command(self):
+        out = io.StringIO()
+        call_command('build_recommendations', '--full', stdout=out)
+        self.assertIn('Rebuilt relations for 5 product(s)', out.getvalue())
+
+
+@override_settings(QUERY_BUDGETS_ENFORCED=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create(username='shopper')
+        self.products = [
+            make_product(name=f'Item {i}', category=('Electronics', 'Footwears')[i % 2], subcategory='Phones' if i % 2 == 0 else None)
+            for i in range(20)
+        ]
+        cart = Cart.objects.create(user=self.user)
+        for product in self.products[:6]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        for i in range(5):
+            self.order = Order.objects.create(
+                user=self.user, reference=f'ref-{i}', total_amount=Decimal('60.00'),
+                shipping_address='1 Road', shipping_city='Lagos', shipping_country='Nigeria', phone='080',
+            )
+            for product in self.products[:6]:
+                self.order.items.create(product=product, quantity=1, price=product.price)
+
+    def test_views_stay_within_their_query_budgets(self):
+        pages = [
+            ('products.views.product_views.landing', reverse('landing')),
+            ('products.views.product_views.all_products', reverse('all_products') + '?q=Item&sort=price_low'),
+            ('products.views.product_views.groceries', reverse('groceries')),
+            ('products.views.product_views.footwears', reverse('footwears')),
+            ('products.views.product_views.vehicles', reverse('vehicles')),
+            ('products.views.product_views.electronics', reverse('electronics') + '?subcategory=Phones'),
+            ('products.views.product_views.product_detail', reverse('product_detail', args=[self.products[0].id])),
+            ('products.views.cart_views.view_cart', reverse('view_cart')),
+            ('products.views.cart_views.get_cart_count', reverse('get_cart_count')),
+            ('products.views.order_views.checkout', reverse('checkout')),
+            ('products.views.order_views.order_history', reverse('order_history')),
+            ('products.views.order_views.order_detail', reverse('order_detail', args=[self.order.id])),
+            ('products.views.profile_views.profile_view', reverse('profile')),
+        ]
+        self.assertEqual({name for name, _ in pages}, set(QUERY_BUDGETS))
+        # Cold caches first, as anonymous and then signed-in visitors; an overrun raises QueryBudgetExceeded
+        for login in (False, True):
+            if login:
+                self.client.force_login(self.user)
+            for name, path in pages:
+                with self.subTest(view=name, login=login):
+                    response = self.client.get(path)
+                    self.assertIn(response.status_code, (200, 302))
+        response = self.client.post(reverse('checkout'), {
+            'address': '1 Road', 'city': 'Lagos', 'country': 'Nigeria', 'phone': '080',
+        })
+        self.assertRedirects(response, reverse('payment', args=[Order.objects.latest('id').id]), fetch_redirect_response=False)
+
+    def test_server_timing_header_and_log_line(self):
+        with self.assertLogs('products.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('product_detail', args=[self.products[0].id]))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", cache;desc="\d+ hits, \d+ misses", tpl;dur=')
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['view'], 'product_detail')
+        self.assertEqual(line['query_budget'], 5)
+        self.assertGreater(line['cache_misses'], 0)
+        self.assertLessEqual(line['queries'], 5)
+
+    def test_overrun_is_raised_when_enforced(self):
+        self.assertEqual(query_budget(2)(lambda request: None).query_budget, 2)
+        QUERY_BUDGETS.pop(f'{__name__}.<lambda>')
+        with mock.patch('products.views.product_views.landing.query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs('products.instrumentation', 'WARNING'):
+                self.client.get(reverse('landing'))
+            # Outside the tests an overrun is only logged
+            clear_caches()
+            with override_settings(QUERY_BUDGETS_ENFORCED=False), self.assertLogs('products.instrumentation', 'WARNING'):
+                self.assertEqual(self.client.get(reverse('landing')).status_code, 200)
+
+
+class BenchmarkTests(TestCase):
+    def test_seed_is_deterministic(self):
+        first = [(p.sku, p.name, p.price, p.category_key, p.subcategory_key) for p in generate_products(50, random.Random(3))]
+        second = [(p.sku, p.name, p.price, p.category_key, p.subcategory_key) for p in generate_products(50, random.Random(3))]
+        self.assertEqual(first, second)
+        self.assertTrue(all(category_key for _, _, _, category_key, _ in first))
+
+    def test_scenarios_run_against_the_urlconf(self):
+        clear_caches()
+        stats = seed_store(products=40, users=3, orders=6, seed=1)
+        self.assertEqual(Order.objects.count(), 6)
+        self.assertTrue(Product.objects.filter(category_key='electronics').exists())
+        catalog = Catalog(stats['first_product_id'], stats['last_product_id'], stats['users'])
+        results = run_benchmark(ClientSession, list(SCENARIOS), catalog, iterations=2)
+        self.assertEqual(set(results), set(SCENARIOS))
+        for name, row in results.items():
+            with self.subTest(scenario=name):
+                self.assertEqual(row['errors'], 0)
+                self.assertGreater(row['queries_per_request'], 0)
+                self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+        # Each checkout round places an order
+        self.assertEqual(Order.objects.count(), 6 + 3)
@@ -4,38 +4,10 @@ from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.http import JsonResponse
 from django.db.models import F
+from ..cart import get_cart_pricing, get_cart_summary, invalidate_cart_summary, merge_session_cart, remember_cart_summary
 from ..models import Product, Cart, CartItem
-
-
-def _migrate_session_cart_to_db(request):
-    """Migrate session cart to database cart when user logs in"""
-    if not request.user.is_authenticated:
-        return
-    
-    session_cart = request.session.get('cart', {})
-    if not session_cart:
-        return
-    
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    
-    for product_id, quantity in session_cart.items():
-        try:
-            product = Product.objects.get(id=int(product_id))
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            if not created:
-                cart_item.quantity = F('quantity') + quantity
-                cart_item.save()
-                cart_item.refresh_from_db()
-        except Product.DoesNotExist:
-            continue
-    
-    # Clear session cart after migration
-    request.session['cart'] = {}
-    request.session.modified = True
+from ..offers import SESSION_KEY, OfferError, apply_offer, get_offer, session_offer
+from ..instrumentation import query_budget
 
 
 @require_POST
@@ -55,62 +27,55 @@ def add_to_cart(request, product_id):
     )
     
     if not created:
-        if cart_item.quantity + 1 > product.stock:
-            messages.warning(request, f"Sorry, only {product.stock} units of {product.name} are available.")
+        if cart_item.quantity + 1 > product.available_stock:
+            messages.warning(request, f"Sorry, only {product.available_stock} units of {product.name} are available.")
             return redirect('product_detail', product_id=product_id)
         cart_item.quantity = F('quantity') + 1
         cart_item.save()
         cart_item.refresh_from_db()
     
+    invalidate_cart_summary(request.user)
     messages.success(request, f"{product.name} has been added to your cart.")
     return redirect('product_detail', product_id=product_id)
 
 
+# The session write when an expired promo code is dropped is one UPDATE (three statements inside a test transaction)
+@query_budget(6)
 def view_cart(request):
-    if not request.user.is_authenticated:
-        # Show session cart for anonymous users
-        cart = request.session.get('cart', {})
-        if not cart:
-            return render(request, 'cart.html', {'cart_items': [], 'cart_total': 0, 'cart_count': 0})
-        
-        product_ids = [int(pid) for pid in cart.keys()]
-        products = Product.objects.filter(id__in=product_ids)
-        cart_items = []
-        cart_total = 0
-        cart_count = 0
-        
-        for product in products:
-            quantity = cart.get(str(product.id), 0)
-            item_total = float(product.price) * quantity
-            cart_total += item_total
-            cart_count += quantity
-            cart_items.append({'product': product, 'quantity': quantity, 'item_total': item_total})
-        
-        return render(request, 'cart.html', {'cart_items': cart_items, 'cart_total': cart_total, 'cart_count': cart_count})
-    
     # Migrate session cart if exists
-    _migrate_session_cart_to_db(request)
-    
-    # Get database cart for authenticated users
-    cart = Cart.objects.filter(user=request.user).first()
-    if not cart:
-        return render(request, 'cart.html', {'cart_items': [], 'cart_total': 0, 'cart_count': 0})
-    
-    cart_items = []
-    cart_total = 0
-    cart_count = 0
+    merge_session_cart(request)
+    
+    pricing = get_cart_pricing(request)
+    if request.user.is_authenticated:
+        remember_cart_summary(request.user, pricing)
+    pricing = apply_offer(pricing, session_offer(request))
+    return render(request, 'cart.html', {
+        'cart_items': pricing.lines,
+        'cart_total': pricing.total,
+        'cart_count': pricing.count,
+        'offer': pricing.offer,
+        'discount': pricing.discount,
+        'cart_payable': pricing.payable,
+    })
+
+
+@require_POST
+def apply_promo_code(request):
+    code = request.POST.get('code', '').strip()
+    if not code or 'remove' in request.POST:
+        request.session.pop(SESSION_KEY, None)
+        messages.success(request, "Promo code removed.")
+        return redirect('view_cart')
     
-    for cart_item in cart.items.select_related('product').all():
-        item_total = float(cart_item.product.price) * cart_item.quantity
-        cart_total += item_total
-        cart_count += cart_item.quantity
-        cart_items.append({
-            'product': cart_item.product,
-            'quantity': cart_item.quantity,
-            'item_total': item_total
-        })
+    try:
+        offer = get_offer(code)
+    except OfferError as e:
+        messages.error(request, str(e))
+        return redirect('view_cart')
     
-    return render(request, 'cart.html', {'cart_items': cart_items, 'cart_total': cart_total, 'cart_count': cart_count})
+    request.session[SESSION_KEY] = offer.code
+    messages.success(request, f"Promo code {offer.code} applied: {offer.description}")
+    return redirect('view_cart')
 
 
 @require_POST
@@ -125,6 +90,7 @@ def remove_from_cart(request, product_id):
     cart = Cart.objects.filter(user=request.user).first()
     if cart:
         CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+        invalidate_cart_summary(request.user)
     
     messages.success(request, "Item removed from cart.")
     return redirect('view_cart')
@@ -154,8 +120,8 @@ def update_cart_quantity(request, product_id):
             if cart_item:
                 # Check stock availability
                 product = cart_item.product
-                if quantity > product.stock:
-                    messages.warning(request, f"Sorry, only {product.stock} units available.")
+                if quantity > product.available_stock:
+                    messages.warning(request, f"Sorry, only {product.available_stock} units available.")
                     return redirect('view_cart')
                 
                 cart_item.quantity = quantity
@@ -164,21 +130,12 @@ def update_cart_quantity(request, product_id):
         else:
             CartItem.objects.filter(cart=cart, product_id=product_id).delete()
             messages.success(request, "Item removed from cart.")
+        invalidate_cart_summary(request.user)
     
     return redirect('view_cart')
 
 
+@query_budget(2)
 def get_cart_count(request):
-    if not request.user.is_authenticated:
-        cart = request.session.get('cart', {})
-        return JsonResponse({'count': sum(cart.values())})
-    
-    # Migrate session cart if exists
-    _migrate_session_cart_to_db(request)
-    
-    cart = Cart.objects.filter(user=request.user).first()
-    if not cart:
-        return JsonResponse({'count': 0})
-    
-    count = sum(item.quantity for item in cart.items.all())
-    return JsonResponse({'count': count})
+    summary = get_cart_summary(request)
+    return JsonResponse({'count': summary['count'], 'total': str(summary['total'])})
@@ -5,105 +5,68 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.conf import settings
-from ..models import Product, Profile, Order, OrderItem, Cart, CartItem
-import secrets
+from django.db.models import DecimalField, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from ..cart import get_cart_pricing
+from ..checkout import CheckoutError, place_order, release_order_stock, reservation_expiring
+from ..models import Profile, Order, OrderItem
+from ..offers import SESSION_KEY, apply_offer, session_offer
+from ..pagination import KeysetPaginator
+from ..payments import settle_payment
+from ..paystack import get_gateway
+from ..webhooks import enqueue_event
+from ..instrumentation import query_budget
+from decimal import Decimal
 import hmac
 import hashlib
 import json
 
 
-def _get_cart_items(request):
-    """Helper function to get cart items for both session and DB carts"""
-    if not request.user.is_authenticated:
-        cart = request.session.get('cart', {})
-        if not cart:
-            return [], 0
-        
-        product_ids = [int(pid) for pid in cart.keys()]
-        products = Product.objects.filter(id__in=product_ids)
-        cart_items = []
-        cart_total = 0
-        
-        for product in products:
-            quantity = cart.get(str(product.id), 0)
-            item_total = float(product.price) * quantity
-            cart_total += item_total
-            cart_items.append({'product': product, 'quantity': quantity, 'item_total': item_total})
-        
-        return cart_items, cart_total
-    
-    # Get database cart for authenticated users
-    cart = Cart.objects.filter(user=request.user).first()
-    if not cart:
-        return [], 0
-    
-    cart_items = []
-    cart_total = 0
-    
-    for cart_item in cart.items.select_related('product').all():
-        item_total = float(cart_item.product.price) * cart_item.quantity
-        cart_total += item_total
-        cart_items.append({
-            'product': cart_item.product,
-            'quantity': cart_item.quantity,
-            'item_total': item_total
-        })
-    
-    return cart_items, cart_total
-
-
-def _clear_cart(request):
-    """Helper function to clear cart after checkout"""
-    if not request.user.is_authenticated:
-        request.session['cart'] = {}
-        return
-    
-    cart = Cart.objects.filter(user=request.user).first()
-    if cart:
-        cart.items.all().delete()
+ORDERS_PER_PAGE = 10
 
 
 @login_required
+@query_budget(14)
 def checkout(request):
-    cart_items, cart_total = _get_cart_items(request)
+    pricing = apply_offer(get_cart_pricing(request), session_offer(request))
     
-    if not cart_items:
+    if not pricing.lines:
         messages.error(request, "Your cart is empty.")
         return redirect('view_cart')
     
     # Check stock availability
-    for item in cart_items:
-        if item['quantity'] > item['product'].stock:
-            messages.error(request, f"Sorry, only {item['product'].stock} units of {item['product'].name} are available.")
+    for line in pricing.lines:
+        if line.quantity > line.product.available_stock:
+            messages.error(request, f"Sorry, only {line.product.available_stock} units of {line.product.name} are available.")
             return redirect('view_cart')
     
     profile = Profile.objects.filter(user=request.user).first()
     
     if request.method == 'POST':
-        reference = f"PS-{secrets.token_hex(8).upper()}"
-        
-        order = Order.objects.create(
-            user=request.user,
-            reference=reference,
-            total_amount=cart_total,
-            shipping_address=request.POST.get('address', profile.address if profile else ''),
-            shipping_city=request.POST.get('city', profile.city if profile else ''),
-            shipping_country=request.POST.get('country', profile.country if profile else ''),
-            phone=request.POST.get('phone', profile.phone if profile else ''),
-        )
+        shipping = {
+            'shipping_address': request.POST.get('address', profile.address if profile else ''),
+            'shipping_city': request.POST.get('city', profile.city if profile else ''),
+            'shipping_country': request.POST.get('country', profile.country if profile else ''),
+            'phone': request.POST.get('phone', profile.phone if profile else ''),
+        }
         
-        for item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=item['product'],
-                quantity=item['quantity'],
-                price=item['product'].price
-            )
+        try:
+            order = place_order(request.user, shipping, offer=pricing.offer)
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('view_cart')
         
-        _clear_cart(request)
+        request.session.pop(SESSION_KEY, None)
         return redirect('payment', order_id=order.id)
     
-    return render(request, 'checkout.html', {'cart_items': cart_items, 'cart_total': cart_total, 'profile': profile})
+    return render(request, 'checkout.html', {
+        'cart_items': pricing.lines,
+        'cart_total': pricing.total,
+        'offer': pricing.offer,
+        'discount': pricing.discount,
+        'cart_payable': pricing.payable,
+        'profile': profile,
+    })
 
 
 @login_required
@@ -114,6 +77,12 @@ def payment(request, order_id):
         messages.info(request, "This order has already been processed.")
         return redirect('order_detail', order_id=order.id)
     
+    # Don't open a payment that could land after the expiry sweep has released the stock
+    if reservation_expiring(order):
+        release_order_stock(order)
+        messages.error(request, "This order's stock reservation has expired. Please add the items to your cart and check out again.")
+        return redirect('order_detail', order_id=order.id)
+    
     context = {
         'order': order,
         'paystack_public_key': settings.PAYSTACK_PUBLIC_KEY,
@@ -125,29 +94,25 @@ def payment(request, order_id):
 @require_POST
 def verify_payment(request, order_id):
     """Manual payment verification (fallback)"""
-    from pypaystack2 import Transaction
-    
     order = get_object_or_404(Order, id=order_id, user=request.user)
     reference = request.POST.get('reference')
     
     if not reference:
         return JsonResponse({'success': False, 'message': 'No reference provided'})
+    # Only this order's own transaction can pay for it
+    if reference != order.reference:
+        return JsonResponse({'success': False, 'message': 'Reference does not match this order'})
     
     try:
-        transaction = Transaction(authorization_key=settings.PAYSTACK_SECRET_KEY)
-        response = transaction.verify(reference=reference)
+        response = get_gateway().verify_transaction(reference)
         
         if response['status'] and response['data']['status'] == 'success':
-            # Only update if not already paid (webhook might have processed it)
-            if order.status == 'pending':
-                order.status = 'paid'
-                order.save()
-                
-                for item in order.items.all():
-                    product = item.product
-                    if product.stock >= item.quantity:
-                        product.stock -= item.quantity
-                        product.save()
+            # No-op if the webhook already processed it
+            if settle_payment(order.reference) == 'refund_due':
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Your order expired before the payment arrived and its items are sold out. Your payment will be refunded.',
+                })
             
             return JsonResponse({'success': True, 'message': 'Payment verified'})
         else:
@@ -174,55 +139,41 @@ def paystack_webhook(request):
     if not hmac.compare_digest(computed_signature, paystack_signature):
         return HttpResponse(status=400)
     
-    # Parse webhook data
+    # Queue the event and ack straight away; the process_webhooks worker applies it
     try:
         data = json.loads(body.decode('utf-8'))
-        event = data.get('event')
-        event_data = data.get('data', {})
-        
-        if event == 'charge.success':
-            reference = event_data.get('reference')
-            status = event_data.get('status')
-            
-            if status == 'success' and reference:
-                # Find order by reference
-                try:
-                    order = Order.objects.get(reference=reference)
-                    
-                    # Only process if order is still pending
-                    if order.status == 'pending':
-                        order.status = 'paid'
-                        order.save()
-                        
-                        # Reduce stock
-                        for item in order.items.all():
-                            product = item.product
-                            if product.stock >= item.quantity:
-                                product.stock -= item.quantity
-                                product.save()
-                        
-                        # Log successful webhook processing
-                        print(f"Webhook processed: Order {reference} marked as paid")
-                
-                except Order.DoesNotExist:
-                    print(f"Order not found for reference: {reference}")
-        
-        return HttpResponse(status=200)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return HttpResponse(status=400)
     
-    except json.JSONDecodeError:
+    if not isinstance(data, dict):
         return HttpResponse(status=400)
-    except Exception as e:
-        print(f"Webhook error: {str(e)}")
-        return HttpResponse(status=500)
+    
+    enqueue_event(data)
+    return HttpResponse(status=200)
+
+
+def _order_summaries(user):
+    """The user's orders with item count and subtotal summed in SQL and their lines prefetched with products"""
+    # Going through the reverse manager hands every order the already-loaded user
+    return user.orders.annotate(
+        item_count=Coalesce(Sum('items__quantity'), 0),
+        items_total=Coalesce(Sum(OrderItem.line_total('items__')), Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    ).prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product').order_by('id')),
+    )
 
 
 @login_required
+@query_budget(5)
 def order_history(request):
-    orders = Order.objects.filter(user=request.user)
+    # Counted fresh each time so a new order shows up straight away; it's one indexed COUNT per user
+    paginator = KeysetPaginator(_order_summaries(request.user), ORDERS_PER_PAGE, count_cache=lambda name, count: count())
+    orders = paginator.get_page(cursor=request.GET.get('cursor'), page=request.GET.get('page'))
     return render(request, 'order_history.html', {'orders': orders})
 
 
 @login_required
+@query_budget(4)
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
+    order = get_object_or_404(_order_summaries(request.user), id=order_id)
     return render(request, 'order_detail.html', {'order': order})
@@ -1,63 +1,81 @@
-from django.shortcuts import render, get_object_or_404
-from django.core.paginator import Paginator
-from django.db.models import Q
-from django.core.cache import cache
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.shortcuts import render
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from ..catalog import cached, cached_listing_count, get_featured_products, get_product, get_related_products
+from ..facets import FacetSet, parse_price
 from ..models import Product
+from ..pagination import KeysetPaginator
+from ..recently_viewed import record_view
+from ..search import search_products
+from ..instrumentation import query_budget
 
 
+SORT_OPTIONS = {'name': 'name', 'price_low': 'price', 'price_high': '-price', 'newest': '-id'}
+
+
+def _apply_sort(products, sort_by, query):
+    if sort_by == 'relevance':
+        # Relevance only means something for a search; plain listings keep name order
+        return products.order_by('-search_rank', 'name') if query else products.order_by('name')
+    if sort_by in SORT_OPTIONS:
+        return products.order_by(SORT_OPTIONS[sort_by])
+    return products
+
+
+def _paginate(request, products):
+    paginator = KeysetPaginator(products, 12, count_cache=cached_listing_count)
+    return paginator.get_page(cursor=request.GET.get('cursor'), page=request.GET.get('page'))
+
+
+@query_budget(3)
 def landing(request):
-    featured_products = []
-    for category in ['Footwears', 'Groceries', 'Electronics', 'Vehicles']:
-        product = Product.objects.filter(category__iexact=category).exclude(image_url__isnull=True).exclude(image_url__exact='').first()
-        if product:
-            featured_products.append(product)
+    featured_products = get_featured_products(['Footwears', 'Groceries', 'Electronics', 'Vehicles'])
     return render(request, 'landing.html', {'featured_products': featured_products})
 
 
+# Cold caches: three facet queries, the count and the page, plus the session user and cart summary
+@query_budget(7)
 def all_products(request):
     query = request.GET.get('q', '').strip()
     category_filter = request.GET.get('category', '')
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
-    sort_by = request.GET.get('sort', 'name')
+    sort_by = request.GET.get('sort', 'relevance')
     
     products = Product.objects.all()
     
     if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query) | Q(category__icontains=query) | Q(subcategory__icontains=query))
+        products = search_products(products, query)
     
     if category_filter:
-        products = products.filter(category__iexact=category_filter)
+        products = products.filter(category_key=Product.normalize_key(category_filter))
     
-    if min_price:
-        try:
-            products = products.filter(price__gte=float(min_price))
-        except ValueError:
-            pass
+    price_floor = parse_price(min_price)
+    if price_floor is not None:
+        products = products.filter(price__gte=price_floor)
     
-    if max_price:
-        try:
-            products = products.filter(price__lte=float(max_price))
-        except ValueError:
-            pass
+    price_ceiling = parse_price(max_price)
+    if price_ceiling is not None:
+        products = products.filter(price__lte=price_ceiling)
     
-    sort_options = {'name': 'name', 'price_low': 'price', 'price_high': '-price', 'newest': '-id'}
-    if sort_by in sort_options:
-        products = products.order_by(sort_options[sort_by])
+    products = _apply_sort(products, sort_by, query)
     
-    categories = cache.get('product_categories')
-    if not categories:
-        categories = list(set(Product.objects.values_list('category', flat=True)))
-        cache.set('product_categories', categories, 300)
+    facets = FacetSet(query, category_filter, '', price_floor, price_ceiling).counts()
     
-    paginator = Paginator(products, 12)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj = _paginate(request, products)
     
     return render(request, 'index.html', {
         'products': page_obj,
         'category': 'All',
         'search_query': query,
-        'categories': categories,
+        'facets': facets,
+        'categories': [facet['label'] for facet in facets['categories']],
         'selected_category': category_filter,
         'min_price': min_price,
         'max_price': max_price,
@@ -70,35 +88,28 @@ def category_view(request, category_name):
     query = request.GET.get('q', '').strip()
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
-    sort_by = request.GET.get('sort', 'name')
+    sort_by = request.GET.get('sort', 'relevance')
     subcategory = request.GET.get('subcategory', '')
     
-    products = Product.objects.filter(category__iexact=category_name)
+    products = Product.objects.filter(category_key=Product.normalize_key(category_name))
     
     if subcategory:
-        products = products.filter(subcategory__iexact=subcategory)
+        products = products.filter(subcategory_key=Product.normalize_key(subcategory))
     
     if query:
-        products = products.filter(Q(name__icontains=query) | Q(description__icontains=query))
+        products = search_products(products, query)
     
-    if min_price:
-        try:
-            products = products.filter(price__gte=float(min_price))
-        except ValueError:
-            pass
+    price_floor = parse_price(min_price)
+    if price_floor is not None:
+        products = products.filter(price__gte=price_floor)
     
-    if max_price:
-        try:
-            products = products.filter(price__lte=float(max_price))
-        except ValueError:
-            pass
+    price_ceiling = parse_price(max_price)
+    if price_ceiling is not None:
+        products = products.filter(price__lte=price_ceiling)
     
-    sort_options = {'name': 'name', 'price_low': 'price', 'price_high': '-price', 'newest': '-id'}
-    if sort_by in sort_options:
-        products = products.order_by(sort_options[sort_by])
+    products = _apply_sort(products, sort_by, query)
     
-    paginator = Paginator(products, 12)
-    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj = _paginate(request, products)
     
     context = {
         'products': page_obj,
@@ -110,39 +121,74 @@ def category_view(request, category_name):
         'is_paginated': page_obj.has_other_pages()
     }
     
+    facets = FacetSet(query, category_name, subcategory, price_floor, price_ceiling).counts()
+    context['facets'] = facets
+    
     if category_name == 'Electronics':
-        subcategories = list(set(Product.objects.filter(category__iexact='Electronics').exclude(subcategory__isnull=True).values_list('subcategory', flat=True)))
-        context['subcategories'] = subcategories
+        context['subcategories'] = [facet['label'] for facet in facets['subcategories']]
         context['selected_subcategory'] = subcategory
     
     return render(request, 'index.html', context)
 
 
+@query_budget(7)
 def groceries(request):
     return category_view(request, 'Groceries')
 
 
+@query_budget(7)
 def footwears(request):
     return category_view(request, 'Footwears')
 
 
+@query_budget(7)
 def vehicles(request):
     return category_view(request, 'Vehicles')
 
 
+@query_budget(7)
 def electronics(request):
     return category_view(request, 'Electronics')
 
 
+def _anonymous_product_page(request, product, related_products):
+    """Rendered anonymous product page with its validators, cached until a product on it changes"""
+    def build():
+        html = render_to_string('product_detail.html', {'product': product, 'related_products': related_products}, request)
+        stamps = [p.updated_at for p in [product, *related_products] if p.updated_at]
+        return {
+            'html': html,
+            'etag': quote_etag(hashlib.md5(html.encode('utf-8')).hexdigest()),
+            'last_modified': max(stamps) if stamps else timezone.now(),
+        }
+
+    # Keyed by what the page shows, so an edit or stock change to any product on it (all bump updated_at) misses
+    shown = [(p.id, p.updated_at) for p in [product, *related_products]]
+    return cached('pages', f"product_detail:{product.id}:{hashlib.md5(repr(shown).encode('utf-8')).hexdigest()}", build)
+
+
+# Cold caches: the product, its relations and the category fallback, plus the session user and cart summary
+@query_budget(5)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    
-    recently_viewed = request.session.get('recently_viewed', [])
-    if product_id not in recently_viewed:
-        recently_viewed.insert(0, product_id)
-        recently_viewed = recently_viewed[:10]
-        request.session['recently_viewed'] = recently_viewed
-    
-    related_products = Product.objects.filter(category=product.category).exclude(id=product_id)[:4]
-    
-    return render(request, 'product_detail.html', {'product': product, 'related_products': related_products})
+    product = get_product(product_id)
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    
+    related_products = get_related_products(product)
+    
+    # Anonymous pages are identical for everyone, so they are rendered once and
+    # revalidated with ETag/Last-Modified; pending flash messages skip the cache.
+    if request.user.is_authenticated or len(get_messages(request)):
+        response = render(request, 'product_detail.html', {'product': product, 'related_products': related_products})
+    else:
+        page = _anonymous_product_page(request, product, related_products)
+        last_modified = int(page['last_modified'].timestamp())
+        response = get_conditional_response(request, etag=page['etag'], last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(page['html'])
+        response['ETag'] = page['etag']
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    
+    record_view(request, response, product.id)
+    return response
@@ -3,19 +3,21 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.http import JsonResponse
-from ..models import Product, Profile
+from ..models import Profile
 from ..forms import ProfileForm, ProductForm
+from ..recently_viewed import forget_recently_viewed, get_recent_products
+from ..instrumentation import query_budget
 
 
 @login_required
+@query_budget(7)
 def profile_view(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
     
     cart = request.session.get('cart', {})
     cart_count = sum(cart.values())
     
-    recently_viewed = request.session.get('recently_viewed', [])
-    recent_products = Product.objects.filter(id__in=recently_viewed[:5]) if recently_viewed else []
+    recent_products = get_recent_products(request)
     
     context = {
         'profile': profile,
@@ -58,5 +60,6 @@ def add_product(request):
 
 @require_POST
 def clear_recently_viewed(request):
-    request.session['recently_viewed'] = []
-    return JsonResponse({'success': True})
+    response = JsonResponse({'success': True})
+    forget_recently_viewed(response)
+    return response
@@ -0,0 +1,93 @@
+import logging
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import WebhookEvent
+from .payments import settle_payment
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+# A claimed event whose worker hasn't reported back by then is handed out again
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+def event_key(payload):
+    """Deduplication key for a Paystack event: its type plus the transaction reference (or id)"""
+    data = payload.get('data') or {}
+    identifier = data.get('reference') or data.get('id') or ''
+    return f"{payload.get('event', '')}:{identifier}"
+
+
+def enqueue_event(payload):
+    """Store an incoming event for the worker; redeliveries of a stored event are ignored"""
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=event_key(payload), event_type=payload.get('event', ''), payload=payload)],
+        ignore_conflicts=True,
+    )
+
+
+def handle_charge_success(payload):
+    data = payload.get('data') or {}
+    reference = data.get('reference')
+    if data.get('status') == 'success' and reference:
+        status = settle_payment(reference)
+        if status is None:
+            logger.warning("Payment %s doesn't match any order", reference)
+        elif status not in ('paid', 'refund_due'):
+            logger.warning("Payment %s arrived for an order that is %s", reference, status)
+
+
+EVENT_HANDLERS = {
+    'charge.success': handle_charge_success,
+}
+
+
+def claim_events(batch_size):
+    """Mark up to `batch_size` due events as processing and return them"""
+    now = timezone.now()
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='processing', locked_at__lt=now - CLAIM_TIMEOUT)
+    with transaction.atomic():
+        queryset = WebhookEvent.objects.filter(due).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            # Lets several workers poll the same table without handing out an event twice
+            queryset = queryset.select_for_update(skip_locked=True)
+        events = list(queryset[:batch_size])
+        WebhookEvent.objects.filter(id__in=[event.id for event in events]).update(status='processing', locked_at=now)
+    return events
+
+
+def process_event(event):
+    handler = EVENT_HANDLERS.get(event.event_type)
+    now = timezone.now()
+    try:
+        if handler:
+            handler(event.payload)
+    except Exception as e:
+        attempts = event.attempts + 1
+        delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+        logger.exception("Webhook event %s failed (attempt %s)", event.event_id, attempts)
+        WebhookEvent.objects.filter(id=event.id).update(
+            status=status, attempts=attempts, next_attempt_at=now + delay, locked_at=None, last_error=str(e),
+        )
+        return False
+
+    WebhookEvent.objects.filter(id=event.id).update(
+        status='done', attempts=event.attempts + 1, processed_at=now, locked_at=None, last_error='',
+    )
+    return True
+
+
+def process_batch(batch_size=50):
+    """Process one batch of due events; returns the number of events handled"""
+    events = claim_events(batch_size)
+    for event in events:
+        process_event(event)
+    return len(events)
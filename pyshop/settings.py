@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'products.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,15 +55,24 @@ ROOT_URLCONF = 'pyshop.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that also reports render time to the instrumentation middleware
+        'BACKEND': 'products.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept per process; runserver's autoreloader
+            # still resets the cache when a template file changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'products.context_processors.cart_summary',
             ],
         },
     },
@@ -81,16 +91,46 @@ DATABASES = {
 }
 
 # Cache Configuration
+# CACHE_URL picks the backend shared by every alias:
+#   locmem://                 per-process memory (default, single worker only)
+#   redis://host:6379/0       Redis, shared by all workers and hosts (needs the `redis` extra)
+#   file:///var/tmp/pyshop    files on local disk, shared by workers on one host
+#   db://pyshop_cache         table in the default database (run `manage.py createcachetable`)
+CACHE_URL = os.getenv('CACHE_URL', 'locmem://')
+
+
+def _cache_config(alias, timeout=300):
+    scheme, _, location = CACHE_URL.partition('://')
+    config = {'TIMEOUT': timeout, 'KEY_PREFIX': f'pyshop:{alias}'}
+    if scheme == 'redis' or scheme == 'rediss':
+        config.update({'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL})
+    elif scheme == 'file':
+        config.update({
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(location, alias),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        })
+    elif scheme == 'db':
+        config.update({
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': location or 'pyshop_cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        })
+    else:
+        config.update({
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'pyshop-{alias}',
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'CULL_FREQUENCY': 3},
+        })
+    return config
+
+
 CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'unique-snowflake',
-        'TIMEOUT': 300,  # 5 minutes
-        'OPTIONS': {
-            'MAX_ENTRIES': 1000,
-            'CULL_FREQUENCY': 3,
-        }
-    }
+    'default': _cache_config('default'),
+    'sessions': _cache_config('sessions', timeout=1209600),
+    'catalog': _cache_config('catalog'),
+    # Used by {% cache %}; fragment keys carry product updated_at, so entries never go stale
+    'template_fragments': _cache_config('template_fragments', timeout=3600),
 }
 
 
@@ -132,7 +172,7 @@ USE_TZ = True
 
 # Performance Settings
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
-SESSION_CACHE_ALIAS = 'default'
+SESSION_CACHE_ALIAS = 'sessions'
 
 # Security Settings
 SECURE_BROWSER_XSS_FILTER = True
@@ -149,6 +189,11 @@ LOGGING = {
             'class': 'logging.FileHandler',
             'filename': BASE_DIR / 'debug.log',
         },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+            'stream': 'ext://sys.stdout',
+        },
     },
     'loggers': {
         'django': {
@@ -156,9 +201,21 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # One JSON line per request from products.instrumentation; stdout so the process manager collects it
+        'products': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
 
+# Request instrumentation (products.instrumentation.InstrumentationMiddleware)
+SERVER_TIMING_HEADER = os.getenv('SERVER_TIMING_HEADER', 'true').lower() == 'true'
+# Raise instead of log when a view exceeds its @query_budget; the test runner turns this on
+QUERY_BUDGETS_ENFORCED = False
+TEST_RUNNER = 'pyshop.test_runner.QueryBudgetRunner'
+
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/2.1/howto/static-files/
@@ -173,6 +230,12 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Paystack settings
 PAYSTACK_SECRET_KEY = os.getenv('PAYSTACK_SECRET_KEY', '')
 PAYSTACK_PUBLIC_KEY = os.getenv('PAYSTACK_PUBLIC_KEY', '')
+PAYSTACK_API_URL = os.getenv('PAYSTACK_API_URL', 'https://api.paystack.co')
+PAYSTACK_TIMEOUT = float(os.getenv('PAYSTACK_TIMEOUT', '5'))
+PAYSTACK_MAX_RETRIES = int(os.getenv('PAYSTACK_MAX_RETRIES', '2'))
+
+# Unpaid orders hold their stock this long before the webhook worker releases it
+STOCK_RESERVATION_MINUTES = int(os.getenv('STOCK_RESERVATION_MINUTES', '30'))
 
 # Jazzmin settings
 JAZZMIN_SETTINGS = {
@@ -195,6 +258,7 @@ JAZZMIN_SETTINGS = {
         "products.Product": "fas fa-box",
         "products.Offer": "fas fa-tag",
         "products.Profile": "fas fa-id-card",
+        "products.WebhookEvent": "fas fa-inbox",
     },
     "default_icon_parents": "fas fa-chevron-circle-right",
     "default_icon_children": "fas fa-circle",
@@ -0,0 +1,21 @@
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryBudgetRunner(DiscoverRunner):
+    """Test runner that enforces @query_budget, so any test driving a view over its budget fails"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._budgets_enforced = getattr(settings, 'QUERY_BUDGETS_ENFORCED', False)
+        settings.QUERY_BUDGETS_ENFORCED = True
+        # One INFO line per test request is noise; overruns and errors still come through
+        self._instrumentation_level = logging.getLogger('products.instrumentation').level
+        logging.getLogger('products.instrumentation').setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        logging.getLogger('products.instrumentation').setLevel(self._instrumentation_level)
+        settings.QUERY_BUDGETS_ENFORCED = self._budgets_enforced
+        super().teardown_test_environment(**kwargs)